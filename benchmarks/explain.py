@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import re
+import sys
+
+os.environ.setdefault("CONVENTION_CONFIG", "test")
+
+import convention  # noqa: E402
+from benchmarks import generator  # noqa: E402
+from convention import migrations, models  # noqa: E402
+
+
+# A search uses an index to find the rows it needs whereas a scan reads the whole table (or index).
+_SCAN = re.compile(r"\bSCAN (TABLE )?(Convention|Restriction)\b")
+
+
+def _exercise(args):
+    # Runs the paths whose queries must use an index, i.e. compiling and serialising conventions (validate and get_data), listing a user's
+    # conventions, and updating restrictions, from cold caches.
+    rng = random.Random(args.seed)
+    user = models.User.query.get(generator.populate(args.users, 2, args.groups, args.values, args.combinations, args.seed)[0])
+    values_convention, combinations_convention = models.Convention.query.filter_by(user=user).order_by(models.Convention.key).all()
+    for cache in (models._compiled_conventions, models._convention_data, models._classifiers):
+        cache.clear()
+    for c in (values_convention, combinations_convention):
+        c._compiled = None
+        c.compiled
+        c.get_data()
+    user.classifier
+    values_convention.update_restrictions(remove_values=[["value0"]] + [[] for _ in range(args.groups - 1)])
+    combinations_convention.update_restrictions(remove_combinations=generator.generate_combinations(args.groups, 1, args.values, rng))
+    combinations_convention.set_restrictions(combinations=generator.generate_combinations(args.groups, args.combinations, args.values, rng))
+    models.db.session.commit()
+
+
+def explain(args):
+    # Captures every statement that the paths issue and returns the query plans of those that scan a table they should search.
+    statements = []
+
+    @models.db.event.listens_for(models.db.engine, "before_cursor_execute")
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")) and not executemany:
+            statements.append((statement, parameters))
+
+    migrations.upgrade()
+    _exercise(args)
+    models.db.event.remove(models.db.engine, "before_cursor_execute", capture)
+    failures = {}
+    for statement, parameters in statements:
+        plan = [row[-1] for row in models.db.engine.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+        if any(_SCAN.search(step) for step in plan):
+            failures[statement] = plan
+    return len(statements), failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the restriction lookups use indexes, rather than scanning tables, in SQLite.")
+    parser.add_argument("--users", type=int, default=2, help="The number of users to generate.")
+    parser.add_argument("--groups", type=int, default=3, help="The number of capturing groups in each convention.")
+    parser.add_argument("--values", type=int, default=10, help="The number of allowable values per group.")
+    parser.add_argument("--combinations", type=int, default=100, help="The number of allowable combinations per convention.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for the random generator.")
+    args = parser.parse_args(argv)
+    with convention.app.app_context():
+        if models.db.engine.dialect.name != "sqlite":
+            parser.error("Query plans can only be checked against SQLite.")
+        statement_count, failures = explain(args)
+    for statement, plan in failures.items():
+        print("%s\n    %s\n" % (" ".join(statement.split()), "\n    ".join(plan)), file=sys.stderr)
+    print("%d of %d statements scan a table." % (len(failures), statement_count), file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import random
+
+from convention import models
+
+
+def get_pattern(group_count):
+    return "_".join(["([a-z0-9]+)"] * group_count)
+
+
+def generate_values(group_count, values_per_group):
+    return [["value%d" % index for index in range(values_per_group)] for _ in range(group_count)]
+
+
+def generate_combinations(group_count, combination_count, values_per_group, rng):
+    # The combinations are unique so there cannot be more of them than there are ways of picking a value for every group.
+    combination_count = min(combination_count, values_per_group ** group_count)
+    combinations = set()
+    while len(combinations) < combination_count:
+        combinations.add(tuple("value%d" % rng.randrange(values_per_group) for _ in range(group_count)))
+    return [list(combination) for combination in combinations]
+
+
+def generate_names(group_count, values_per_group, name_count, rng, invalid_ratio=0.1):
+    # A proportion of the names use a value outside of the allowable values, and a few do not match the pattern at all.
+    names = []
+    for _ in range(name_count):
+        roll = rng.random()
+        if roll < invalid_ratio / 2:
+            names.append("invalid-name")
+        else:
+            values = ["value%d" % rng.randrange(values_per_group) for _ in range(group_count)]
+            if roll < invalid_ratio:
+                values[rng.randrange(group_count)] = "other"
+            names.append("_".join(values))
+    return names
+
+
+def populate(user_count=10, conventions_per_user=10, group_count=5, values_per_group=50, combination_count=1000, seed=0, password=None,
+             storage=None):
+    # Creates users, each with conventions alternately restricting values and combinations, and returns the user keys. Only the first user is
+    # given the password as hashing is deliberately slow.
+    rng = random.Random(seed)
+    pattern = get_pattern(group_count)
+    values = generate_values(group_count, values_per_group)
+    user_keys = []
+    for user_index in range(user_count):
+        user = models.User(email="user%d@example.com" % user_index, first_name="User", last_name=str(user_index))
+        if password is not None and not user_index:
+            user.password = password
+        models.db.session.add(user)
+        for convention_index in range(conventions_per_user):
+            if convention_index % 2:
+                c = models.Convention("Convention %d" % convention_index, user, pattern, True, combinations=generate_combinations(
+                    group_count, combination_count, values_per_group, rng), storage=storage)
+            else:
+                c = models.Convention("Convention %d" % convention_index, user, pattern, True, values=values, storage=storage)
+            models.db.session.add(c)
+        models.db.session.commit()
+        user_keys.append(user.key)
+    return user_keys
@@ -0,0 +1,45 @@
+import os
+import random
+import time
+
+os.environ.setdefault("CONVENTION_CONFIG", "test")
+
+from benchmarks import generator  # noqa: E402
+from convention import models  # noqa: E402
+
+
+_GROUP_COUNT = 5
+_COMBINATION_COUNT = 20000  # 100k combination cells
+_VALUES_PER_GROUP = 200
+
+
+def main():
+    models.db.create_all()
+    user = models.User(email="benchmark@example.com")
+    models.db.session.add(user)
+    models.db.session.commit()
+    user_key = user.key
+    combinations = generator.generate_combinations(_GROUP_COUNT, _COMBINATION_COUNT, _VALUES_PER_GROUP, random.Random(0))
+    pattern = generator.get_pattern(_GROUP_COUNT)
+    cell_count = _GROUP_COUNT * _COMBINATION_COUNT
+    for storage in models.STORAGES:
+        start = time.perf_counter()
+        c = models.Convention("Benchmark", models.User.query.get(user_key), pattern, True, combinations=combinations, storage=storage)
+        models.db.session.add(c)
+        models.db.session.commit()
+        print("[%s] Created convention with %d combination cells in %.2fs" % (storage, cell_count, time.perf_counter() - start))
+        start = time.perf_counter()
+        c.set_restrictions(combinations=combinations[::-1])
+        models.db.session.commit()
+        print("[%s] Replaced %d combination cells in %.2fs" % (storage, cell_count, time.perf_counter() - start))
+        convention_key = c.key
+        models.db.session.expunge_all()
+        models._compiled_conventions.clear()
+        start = time.perf_counter()
+        c = models.Convention.query.get(convention_key)
+        c.compiled
+        print("[%s] Loaded and compiled %d combination cells in %.2fs" % (storage, cell_count, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
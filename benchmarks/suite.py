@@ -0,0 +1,259 @@
+import argparse
+import base64
+import collections
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+
+os.environ.setdefault("CONVENTION_CONFIG", "test")
+
+import convention  # noqa: E402
+import convention.api.views  # noqa: E402
+import convention.users  # noqa: E402
+from benchmarks import generator  # noqa: E402
+from convention import models  # noqa: E402
+
+
+_PASSWORD = "benchmark"
+
+_benchmarks = collections.OrderedDict()
+
+
+def _benchmark(name):
+    # Each benchmark is given the fixture and returns a function to be timed along with the number of operations performed per call.
+    def decorator(f):
+        _benchmarks[name] = f
+        return f
+    return decorator
+
+
+def _get_basic_auth(username, password):
+    return {"Authorization": "Basic " + base64.b64encode(("%s:%s" % (username, password)).encode("UTF-8")).decode("ASCII")}
+
+
+def _request(client, method, url, headers):
+    # A failing request would be timed as a (probably much faster) error response so it stops the run instead.
+    response = client.open(url, method=method, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError("%s %s returned %s." % (method, url, response.status))
+    return response
+
+
+@_benchmark("validate")
+def _validate(fixture):
+    c = fixture["values_convention"]
+    names = fixture["names"]
+    return lambda: [c.validate(name) for name in names], len(names)
+
+
+@_benchmark("validate_combinations")
+def _validate_combinations(fixture):
+    c = fixture["combinations_convention"]
+    names = fixture["names"]
+    return lambda: [c.validate(name) for name in names], len(names)
+
+
+def _validate_uncached(c, names):
+    # The memoised results are cleared before every name, rather than once per run, because the generated names can repeat.
+    def run():
+        results = []
+        for name in names:
+            models._validation_results.clear()
+            results.append(c.validate(name))
+        return results
+    return run, len(names)
+
+
+@_benchmark("validate_uncached")
+def _validate_values_uncached(fixture):
+    return _validate_uncached(fixture["values_convention"], fixture["names"])
+
+
+@_benchmark("validate_combinations_uncached")
+def _validate_combinations_uncached(fixture):
+    return _validate_uncached(fixture["combinations_convention"], fixture["names"])
+
+
+@_benchmark("compile")
+def _compile(fixture):
+    c = fixture["combinations_convention"]
+
+    def run():
+        models._compiled_conventions.clear()
+        c._compiled = None
+        return c.compiled
+    return run, 1
+
+
+@_benchmark("get_data")
+def _get_data(fixture):
+    return fixture["combinations_convention"].get_data, 1
+
+
+@_benchmark("get_data_uncached")
+def _get_data_uncached(fixture):
+    c = fixture["combinations_convention"]
+
+    def run():
+        models._convention_data.clear()
+        return c.get_data()
+    return run, 1
+
+
+@_benchmark("set_restrictions_values")
+def _set_restrictions_values(fixture):
+    c = fixture["values_convention"]
+    values = fixture["values"]
+
+    def run():
+        c.set_restrictions(values=values)
+        models.db.session.commit()
+    return run, 1
+
+
+@_benchmark("set_restrictions_combinations")
+def _set_restrictions_combinations(fixture):
+    c = fixture["combinations_convention"]
+    combinations = fixture["combinations"]
+
+    def run():
+        c.set_restrictions(combinations=combinations)
+        models.db.session.commit()
+    return run, 1
+
+
+@_benchmark("get_conventions")
+def _get_conventions(fixture):
+    client = fixture["client"]
+    headers = fixture["token_headers"]
+    return lambda: _request(client, "GET", "/api/conventions/", headers), 1
+
+
+@_benchmark("get_conventions_expand")
+def _get_conventions_expand(fixture):
+    client = fixture["client"]
+    headers = fixture["token_headers"]
+    return lambda: _request(client, "GET", "/api/conventions/?expand=1", headers), 1
+
+
+@_benchmark("auth_request_token")
+def _auth_request_token(fixture):
+    client = fixture["client"]
+    headers = _get_basic_auth(fixture["email"], _PASSWORD)
+    return lambda: _request(client, "POST", "/api/request-token", headers), 1
+
+
+@_benchmark("auth_verify_token")
+def _auth_verify_token(fixture):
+    token = fixture["token"]
+    return lambda: models.User.verify_auth_token(token), 1
+
+
+@_benchmark("auth_verify_token_uncached")
+def _auth_verify_token_uncached(fixture):
+    token = fixture["token"]
+
+    def run():
+        models._auth_tokens.clear()
+        models._users.clear()
+        return models.User.verify_auth_token(token)
+    return run, 1
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _create_fixture(args):
+    user_keys = generator.populate(args.users, args.conventions, args.groups, args.values, args.combinations, args.seed, _PASSWORD, args.storage)
+    user = models.User.query.get(user_keys[0])
+    conventions = models.Convention.query.filter_by(user=user).order_by(models.Convention.key).all()
+    rng = random.Random(args.seed)
+    token = user.generate_auth_token()
+    return {
+        "email": user.email,
+        "values_convention": conventions[0],
+        "combinations_convention": next(c for c in conventions if c.combinations_restricted),
+        "values": generator.generate_values(args.groups, args.values),
+        "combinations": generator.generate_combinations(args.groups, args.combinations, args.values, rng),
+        "names": generator.generate_names(args.groups, args.values, args.names, rng),
+        "client": convention.app.test_client(),
+        "token": token,
+        "token_headers": _get_basic_auth(token, "")
+    }
+
+
+def run(args):
+    models.db.create_all()
+    fixture = _create_fixture(args)
+    results = collections.OrderedDict()
+    for name, create in _benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        f, operations = create(fixture)
+        f()  # Warm up, e.g. to populate any caches that the benchmark is measuring the benefit of.
+        timings = [timing / operations for timing in timeit.Timer(f).repeat(args.repeat, 1)]
+        results[name] = {
+            "operations": operations,
+            "repeat": args.repeat,
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.mean(timings)
+        }
+        print("%-32s %12.3fus per operation (median)" % (name, results[name]["median"] * 1e6), file=sys.stderr)
+    return {
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {parameter: getattr(args, parameter) for parameter in ("users", "conventions", "groups", "values", "combinations", "names",
+                                                                             "seed", "storage")},
+        "results": results
+    }
+
+
+def compare(results, baseline):
+    # Prints the change in median time for every benchmark present in both sets of results.
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is not None:
+            print("%-32s %+8.1f%%" % (name, (result["median"] / base["median"] - 1) * 100), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the hot paths against a synthetic in-memory database and write the results as JSON.")
+    parser.add_argument("--users", type=int, default=10, help="The number of users to generate.")
+    parser.add_argument("--conventions", type=int, default=10, help="The number of conventions to generate per user.")
+    parser.add_argument("--groups", type=int, default=5, help="The number of capturing groups in each convention.")
+    parser.add_argument("--values", type=int, default=50, help="The number of allowable values per group.")
+    parser.add_argument("--combinations", type=int, default=1000, help="The number of allowable combinations per convention.")
+    parser.add_argument("--names", type=int, default=1000, help="The number of names to validate per operation.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for the random generator.")
+    parser.add_argument("--storage", choices=models.STORAGES, help="The restriction storage for generated conventions.")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of times to time each benchmark.")
+    parser.add_argument("--only", action="append", choices=list(_benchmarks), help="Run only the given benchmark. May be given more than once.")
+    parser.add_argument("-o", "--output", default="-", help="The file to write results to. Defaults to stdout.")
+    parser.add_argument("--compare", help="A previous results file to compare against.")
+    args = parser.parse_args(argv)
+    with convention.app.app_context():
+        results = run(args)
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=4)
+        print()
+    else:
+        with open(args.output, "w", encoding="UTF-8") as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        with open(args.compare, encoding="UTF-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,18 @@ from convention import config
 
 
 _THIS_DIRECTORY = os.path.dirname(__file__)
+_SECRET_KEY_LENGTH = 24
 
 
 app = flask.Flask(__name__, instance_path=os.path.join(_THIS_DIRECTORY, "instance"), instance_relative_config=True)
 dotenv.load_dotenv(os.path.join(_THIS_DIRECTORY, "config.env"))
 app.config.from_object(config.CONFIGURATIONS[os.environ.get("CONVENTION_CONFIG")])
 app.config.from_pyfile(os.environ.get("CONVENTION_CONFIG_OVERRIDE_PATH"), silent=True)
+# Tokens signed by one process must verify in every other so, unless configured, the key is taken from the environment. Failing that, it is
+# generated per process, which only suits a single process, so serve refuses to start. Nothing is written to the (possibly read-only and
+# packaged) instance folder.
+if app.config["SECRET_KEY"] is None:
+    app.config["SECRET_KEY"] = os.environ.get("CONVENTION_SECRET_KEY") or None
+secret_key_generated = app.config["SECRET_KEY"] is None
+if secret_key_generated:
+    app.config["SECRET_KEY"] = os.urandom(_SECRET_KEY_LENGTH)
@@ -26,7 +26,6 @@ def before_request():
 
 @token_auth.verify_password
 def _verify_token(token, password):
-    print(flask_login.current_user)
     if flask_login.current_user.is_authenticated:
         flask.g.current_user = flask_login.current_user
         return True
@@ -1,30 +1,66 @@
+import json
+
 import flask
 
 import convention
-from convention import api, decorators, models
+from convention import api, decorators, models, serialisers, sync, utilities
+
+
+_MAX_EXTRACT_CHUNK_SIZE = 10000
+_MAX_SUGGESTIONS = 100
 
 
 def _get_convention(convention_key):
-    c = models.Convention.query.get_or_404(convention_key).first()
+    # The session only holds weak references so the convention is kept for the rest of the request, e.g. from the ETag check to the view.
+    conventions = flask.g.setdefault("conventions", {})
+    c = conventions.get(convention_key)
+    if c is None:
+        c = conventions[convention_key] = models.Convention.query.get_or_404(convention_key)
     if c.user != flask.g.current_user:
         flask.abort(401)
     return c
 
 
+def _get_convention_version(convention_key, **kwargs):
+    # The owner's details form part of the convention data so their last update is included alongside the convention version.
+    c = _get_convention(convention_key)
+    return "%s:%s:%s" % (c.key, c.version, flask.g.current_user.last_updated_utc)
+
+
+def _get_conventions_version(**kwargs):
+    # The user's conventions version changes whenever any of their conventions is added, changed or deleted, so only the user's row is read,
+    # rather than the version of every convention. The user may have been cached so the row is read afresh.
+    users = models.db.session.query(models.User.last_updated_utc, models.User.conventions_version)
+    return "%s:%s" % users.filter(models.User.key == flask.g.current_user.key).one()
+
+
 def _get_convention_url(convention_key):
     return flask.url_for("api.get_convention", convention_key=convention_key, _external=True)
 
 
+def _stream_lines(lines):
+    def generate():
+        try:
+            for line in lines:
+                yield json.dumps(line) + "\n"
+        except ValueError as e:
+            # The response has already started streaming so an invalid request body can only be reported in-band.
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return flask.Response(flask.stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 @convention.app.route("/api/request-token", methods=["POST"])
 @decorators.add_cache_control()
 @api.password_auth.login_required
+@decorators.read_only
 @decorators.to_json
 def request_token():
     return {"token": flask.g.current_user.generate_auth_token() + ":"}
 
 
 @api.blueprint.route("/conventions/")
-@decorators.add_etag
+@decorators.add_etag(_get_conventions_version)
 @decorators.to_json
 @decorators.add_collection_controls("api.get_convention", "convention_key")
 def get_conventions():
@@ -34,21 +70,61 @@ def get_conventions():
 @api.blueprint.route("/conventions/", methods=["POST"])
 @decorators.to_json
 def add_convention():
-    data = flask.request.get_json(force=True)
-    c = models.Convention(data["name"], flask.g.current_user, data["pattern"], data.get("is_regex", False), data.get("values"),
-                          data.get("combinations"), data.get("combinations_restricted"))
+    data = serialisers.load_request(flask.request)
+    try:
+        c = models.Convention(data["name"], flask.g.current_user, data["pattern"], data.get("is_regex", False), data.get("values"),
+                              data.get("combinations"), data.get("combinations_restricted"), data.get("storage"))
+    except models.ConventionException as e:
+        flask.abort(400, str(e))
+    for source in data.get("sources", ()):
+        if source["adapter"] not in sync.ADAPTERS:
+            flask.abort(400, "Unknown source adapter '%s'." % source["adapter"])
+        # The interval is only passed if given so that the column default otherwise applies.
+        c.sources.append(models.Source(group_number=source["group"], adapter=source["adapter"], location=source["location"],
+                                       argument=source.get("argument"), **{"interval": source["interval"]} if "interval" in source else {}))
     models.db.session.add(c)
     models.db.session.commit()
     return {}, 201, {"Location": _get_convention_url(c.key)}
 
 
+@api.blueprint.route("/conventions/classify/<s>")
+@decorators.add_etag(_get_conventions_version)
+@decorators.to_json
+def classify(s):
+    return {"conventions": flask.g.current_user.classifier.classify(s)}
+
+
+@api.blueprint.route("/conventions/classify", methods=["POST"])
+@decorators.add_cache_control()
+@decorators.read_only
+def classify_batch():
+    classifier = flask.g.current_user.classifier
+    return _stream_lines({"name": s, "conventions": classifier.classify(s)} if isinstance(s, str) else {"name": s, "error": "Names must be strings."}
+                         for s in utilities.iter_request_items(flask.request))
+
+
 @api.blueprint.route("/conventions/<int:convention_key>")
-@decorators.add_etag
+@decorators.add_etag(_get_convention_version)
 @decorators.to_json
 def get_convention(convention_key):
     return _get_convention(convention_key).get_data()
 
 
+@api.blueprint.route("/conventions/<int:convention_key>", methods=["PATCH"])
+@decorators.to_json
+def update_convention(convention_key):
+    data = serialisers.load_request(flask.request)
+    c = _get_convention(convention_key)
+    try:
+        if "storage" in data:
+            c.set_storage(data["storage"])
+        c.update_restrictions(data.get("add_values"), data.get("remove_values"), data.get("add_combinations"), data.get("remove_combinations"))
+    except models.ConventionException as e:
+        flask.abort(400, str(e))
+    models.db.session.commit()
+    return
+
+
 @api.blueprint.route("/conventions/<int:convention_key>", methods=["DELETE"])
 @decorators.to_json
 def delete_convention(convention_key):
@@ -57,11 +133,62 @@ def delete_convention(convention_key):
     return
 
 
+@api.blueprint.route("/conventions/<int:convention_key>/sync", methods=["POST"])
+@decorators.to_json
+def sync_convention(convention_key):
+    sync.trigger(_get_convention(convention_key))
+    return {}, 202, {"Location": _get_convention_url(convention_key)}
+
+
 @api.blueprint.route("/conventions/<int:convention_key>/validate/<s>")
-@decorators.add_etag
+@decorators.add_etag(_get_convention_version)
 @decorators.to_json
 def validate(convention_key, s):
     return _get_convention(convention_key).validate(s)
 
 
+@api.blueprint.route("/conventions/<int:convention_key>/snapshot")
+@decorators.add_etag(_get_convention_version)
+@decorators.to_json
+def get_snapshot(convention_key):
+    return _get_convention(convention_key).get_snapshot()
+
+
+@api.blueprint.route("/conventions/<int:convention_key>/suggest/<group>")
+@decorators.add_etag(_get_convention_version)
+@decorators.to_json
+def suggest(convention_key, group):
+    compiled = _get_convention(convention_key).compiled
+    group_number = compiled.get_group_number(group)
+    if group_number is None:
+        flask.abort(404)
+    # Any other query arguments that refer to a group are treated as the values already entered for that group.
+    values = {}
+    for label, value in flask.request.args.items():
+        other_group_number = compiled.get_group_number(label)
+        if other_group_number is not None and other_group_number != group_number:
+            values[other_group_number] = value
+    limit = max(1, min(flask.request.args.get("limit", 10, type=int), _MAX_SUGGESTIONS))
+    return {"suggestions": compiled.suggest(group_number, flask.request.args.get("prefix", ""), values, limit)}
+
+
+@api.blueprint.route("/conventions/<int:convention_key>/validate", methods=["POST"])
+@decorators.add_cache_control()
+@decorators.read_only
+def validate_batch(convention_key):
+    compiled = _get_convention(convention_key).compiled
+    return _stream_lines({"name": s, "valid": compiled.validate(s)} if isinstance(s, str) else {"name": s, "error": "Names must be strings."}
+                         for s in utilities.iter_request_items(flask.request))
+
+
+@api.blueprint.route("/conventions/<int:convention_key>/extract", methods=["POST"])
+@decorators.add_cache_control()
+@decorators.read_only
+def extract(convention_key):
+    compiled = _get_convention(convention_key).compiled
+    chunk_size = max(1, min(flask.request.args.get("chunk_size", _MAX_EXTRACT_CHUNK_SIZE, type=int), _MAX_EXTRACT_CHUNK_SIZE))
+    # Anything other than a string cannot match the pattern so is treated as a null name to keep the columns aligned with the input.
+    return _stream_lines(compiled.extract((s if isinstance(s, str) else None for s in utilities.iter_request_items(flask.request)), chunk_size))
+
+
 convention.app.register_blueprint(api.blueprint, url_prefix="/api")
@@ -0,0 +1,114 @@
+import argparse
+import collections
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import convention
+from convention import models, snapshots
+
+
+_compiled_conventions = None
+
+
+def _init_worker(compiled_conventions):
+    global _compiled_conventions
+    _compiled_conventions = compiled_conventions
+
+
+def _validate_chunk(chunk):
+    return [(line_number, name, convention_key) for line_number, name in chunk for convention_key, compiled in _compiled_conventions
+            if not compiled.validate(name)]
+
+
+def _read_names(f, column=None):
+    if column is None:
+        return (line.rstrip("\r\n") for line in f)
+    reader = csv.DictReader(f)
+    if column not in (reader.fieldnames or ()):
+        raise SystemExit("The column '%s' was not found in the input." % column)
+    return (row[column] for row in reader)
+
+
+def load_compiled_conventions(convention_keys, database_uri=None):
+    if database_uri is not None:
+        convention.app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    compiled_conventions = []
+    for convention_key in convention_keys:
+        c = models.Convention.query.get(convention_key)
+        if c is None:
+            raise SystemExit("The convention %s does not exist." % convention_key)
+        compiled_conventions.append((c.key, c.compiled))
+    return compiled_conventions
+
+
+def load_snapshots(paths):
+    compiled_conventions = []
+    for path in paths:
+        with open(path, encoding="UTF-8") as f:
+            snapshot = json.load(f)
+        compiled_conventions.append((snapshot["key"], snapshots.decode(snapshot)))
+    return compiled_conventions
+
+
+def audit(names, compiled_conventions, output, processes=None, chunk_size=10000):
+    # The input is consumed lazily in chunks with a bounded number of chunks in flight so that memory stays flat however large the input is.
+    # Violations are written in input order as soon as each chunk completes.
+    writer = csv.writer(output)
+    writer.writerow(("Line", "Name", models.Convention.key.name))
+    processes = processes or os.cpu_count()
+    numbered_names = enumerate(names, 1)
+    chunks = iter(lambda: list(itertools.islice(numbered_names, chunk_size)), [])
+    pending = collections.deque()
+    counts = collections.Counter()
+    with multiprocessing.Pool(processes, _init_worker, (compiled_conventions, )) as pool:
+        for chunk in chunks:
+            counts["names"] += len(chunk)
+            pending.append(pool.apply_async(_validate_chunk, (chunk, )))
+            if len(pending) >= processes * 2:
+                violations = pending.popleft().get()
+                counts["violations"] += len(violations)
+                writer.writerows(violations)
+        while pending:
+            violations = pending.popleft().get()
+            counts["violations"] += len(violations)
+            writer.writerows(violations)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a file of names against one or more conventions, writing any violations as CSV.")
+    parser.add_argument("input", help="A newline delimited file of names, or a CSV file if --column is given. Use - to read from stdin.")
+    parser.add_argument("-c", "--convention", dest="convention_keys", action="append", type=int, default=[],
+                        help="The key of a convention to validate against. May be given more than once.")
+    parser.add_argument("-s", "--snapshot", dest="snapshot_paths", action="append", default=[],
+                        help="The path of an exported convention snapshot to validate against. May be given more than once.")
+    parser.add_argument("--column", help="The header of the CSV column that contains the names.")
+    parser.add_argument("--database", help="A database URI to read conventions from instead of the configured database.")
+    parser.add_argument("-o", "--output", default="-", help="The file to write violations to. Defaults to stdout.")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(), help="The number of worker processes.")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="The number of names sent to a worker at a time.")
+    args = parser.parse_args(argv)
+    if not args.convention_keys and not args.snapshot_paths:
+        parser.error("At least one convention or snapshot is required.")
+    compiled_conventions = load_snapshots(args.snapshot_paths)
+    if args.convention_keys:
+        compiled_conventions.extend(load_compiled_conventions(args.convention_keys, args.database))
+    start = time.time()
+    input_file = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="UTF-8")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="UTF-8")
+    try:
+        counts = audit(_read_names(input_file, args.column), compiled_conventions, output_file, args.processes, args.chunk_size)
+    finally:
+        for f in (input_file, output_file):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+    print("Validated %d names with %d violations in %.1fs." % (counts["names"], counts["violations"], time.time() - start), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
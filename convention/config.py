@@ -2,9 +2,41 @@ import os
 
 
 class Config(object):
+    AUTH_CACHE_SIZE = 10000
+    AUTH_CACHE_TTL = 60
+    CLASSIFIER_CACHE_SIZE = 1000
+    COMPILED_CONVENTION_CACHE_SIZE = 1000
+    CONVENTION_DATA_CACHE_SIZE = 1000
+    DATABASE_READ_YOUR_WRITES_CACHE_SIZE = 10000  # The number of users who have written recently that each process remembers.
+    DATABASE_READ_YOUR_WRITES_SECONDS = 10
+    DATABASE_REPLICAS = ()  # The keys of the SQLALCHEMY_BINDS that replicate SQLALCHEMY_DATABASE_URI and are used for read only requests.
     DEBUG = False
-    SECRET_KEY = os.urandom(24)
+    DEFAULT_CONVENTION_STORAGE = "rows"
+    MAX_NAME_LENGTH = 1000  # Longer names are never valid, which bounds the time taken to match any one name.
+    METRICS_SLOW_REQUEST_SECONDS = None
+    REGEX_ENGINE = "auto"
+    REGEX_STEP_BUDGET = 50000  # Each step of the linear engine takes a few microseconds, so this is roughly a fifth of a second per name.
+    REJECT_SUPERLINEAR_PATTERNS = False
+    SECRET_KEY = None  # Taken from the CONVENTION_SECRET_KEY environment variable, or generated per process, if not set.
+    SNAPSHOT_CACHE_SIZE = 1000
+    # Applies to the primary and every replica, e.g. {"pool_size": 10, "max_overflow": 20, "pool_recycle": 3600, "pool_timeout": 30}. SQLite
+    # does not pool connections so these only apply to database servers.
+    SQLALCHEMY_ENGINE_OPTIONS = {}
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Applied to every SQLite connection. WAL lets readers proceed whilst a write is in progress, which otherwise locks the whole database.
+    SQLITE_PRAGMAS = {
+        "busy_timeout": 5000,
+        "cache_size": -65536,
+        "journal_mode": "WAL",
+        "mmap_size": 268435456,
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY"
+    }
+    SYNC_ENABLED = False
+    SYNC_MAX_WORKERS = 8
+    SYNC_POLL_INTERVAL = 60
+    SYNC_TIMEOUT = 30
+    VALIDATION_CACHE_SIZE = 100000
     OAUTH_CREDENTIALS = {
         "facebook": {
             "key": os.environ.get("CONVENTION_FACEBOOK_CONSUMER_KEY"),
@@ -19,12 +51,15 @@ class Config(object):
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    METRICS_SLOW_REQUEST_SECONDS = 1
+    SYNC_ENABLED = True
     SQLALCHEMY_DATABASE_URI = r"sqlite:///" + os.path.join(os.path.dirname(os.path.dirname(__file__)), "convention.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = True
 
 
 class TestConfig(Config):
-    SQLALCHEMY_DATABASE_URI = r"sqlite://:memory:"
+    SECRET_KEY = os.urandom(24)
+    SQLALCHEMY_DATABASE_URI = r"sqlite://"
 
 
 CONFIGURATIONS = {
@@ -1,8 +1,22 @@
+import base64
+import binascii
 import hashlib
+import itertools
+import zlib
 
 import flask
 import wrapt
 
+from convention import metrics, serialisers
+
+
+_URL_PLACEHOLDER = 8191819181918191
+_MIN_COMPRESSION_SIZE = 1024
+_COMPRESSION_WBITS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS
+}
+
 
 def add_cache_control(*directives):
     @wrapt.decorator
@@ -13,50 +27,144 @@ def add_cache_control(*directives):
     return wrapper
 
 
+@wrapt.decorator
+def read_only(wrapped, instance, args, kwargs):
+    # Marks a view that never writes, despite its method, e.g. because it takes a batch of names as its body, so that it may read from a
+    # replica.
+    flask.g.read_only = True
+    return wrapped(*args, **kwargs)
+
+
+def _decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode("ASCII")))
+    except (ValueError, binascii.Error):
+        flask.abort(400)
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(str(key).encode("ASCII")).decode("ASCII")
+
+
+def _get_url_builder(endpoint, endpoint_ident_name):
+    # Building a URL is relatively expensive so we build one with a placeholder and then substitute each item's key into it.
+    prefix, _, suffix = flask.url_for(endpoint, _external=True, **{endpoint_ident_name: _URL_PLACEHOLDER}).rpartition(str(_URL_PLACEHOLDER))
+    return lambda key: "%s%s%s" % (prefix, key, suffix)
+
+
+def _paginate_by_cursor(query, max_per_page, kwargs):
+    # Keyset pagination: rather than counting and offsetting, each page continues from the last key of the previous page so deep pages cost
+    # the same as the first. The total is only counted on request.
+    cursor = flask.request.args.get("cursor")
+    # A page must hold at least one item as the next cursor is taken from the last item of the page.
+    per_page = max(1, min(flask.request.args.get("per_page", max_per_page, type=int), max_per_page))
+    expand = flask.request.args.get("expand")
+    key_column = query.column_descriptions[0]["entity"].key
+    items = query.filter(key_column > _decode_cursor(cursor)) if cursor else query
+    items = items.order_by(key_column).limit(per_page + 1).all()
+    next_cursor = _encode_cursor(items[per_page - 1].key) if len(items) > per_page else None
+    del items[per_page:]
+    return items, {
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "next_page_url": flask.url_for(flask.request.endpoint, cursor=next_cursor, per_page=per_page, expand=expand, _external=True,
+                                       **kwargs) if next_cursor is not None else None,
+        "total_items": query.order_by(None).count() if flask.request.args.get("total") else None
+    }
+
+
+def _paginate_by_page(query, max_per_page, kwargs):
+    page = flask.request.args.get("page", 1, type=int)
+    per_page = min(flask.request.args.get("per_page", max_per_page, type=int), max_per_page)
+    paginator = query.paginate(page, per_page)
+    expand = flask.request.args.get("expand")
+    return paginator.items, {
+        "page": page,
+        "per_page": per_page,
+        "total_pages": paginator.pages,
+        "first_page_url": flask.url_for(flask.request.endpoint, page=1, per_page=per_page, expand=expand, _external=True, **kwargs),
+        "previous_page_url": flask.url_for(flask.request.endpoint, page=paginator.prev_num, per_page=per_page, expand=expand, _external=True,
+                                           **kwargs) if paginator.has_prev else None,
+        "next_page_url": flask.url_for(flask.request.endpoint, page=paginator.next_num, per_page=per_page, expand=expand, _external=True,
+                                       **kwargs) if paginator.has_next else None,
+        "last_page_url": flask.url_for(flask.request.endpoint, page=paginator.pages, per_page=per_page, expand=expand, _external=True,
+                                       **kwargs),
+        "total_items": paginator.total,
+    }
+
+
 def add_collection_controls(expand_endpoint, endpoint_ident_name, max_per_page=10):
     @wrapt.decorator
     def wrapper(wrapped, instance, args, kwargs):
-        page = flask.request.args.get("page", 1, type=int)
-        per_page = min(flask.request.args.get("per_page", max_per_page, type=int), max_per_page)
-        paginator = wrapped(*args, **kwargs).paginate(page, per_page)
-        expand = flask.request.args.get("expand")
+        query = wrapped(*args, **kwargs)
+        if "cursor" in flask.request.args:
+            items, metadata = _paginate_by_cursor(query, max_per_page, kwargs)
+        else:
+            items, metadata = _paginate_by_page(query, max_per_page, kwargs)
+        if flask.request.args.get("expand"):
+            items = [item.get_data() for item in items]
+        else:
+            get_url = _get_url_builder(expand_endpoint, endpoint_ident_name)
+            items = [get_url(item.key) for item in items]
         return {
-            "items": [item.get_data() for item in paginator.items] if expand else [flask.url_for(expand_endpoint, endpoint_ident_name=item.key,
-                                                                                                 _external=True) for item in paginator.items],
-            "metadata": {
-                "page": page,
-                "per_page": per_page,
-                "total_pages": paginator.pages,
-                "first_page_url": flask.url_for(flask.request.endpoint, page=1, per_page=per_page, expand=expand, _external=True, **kwargs),
-                "previous_page_url": flask.url_for(flask.request.endpoint, page=paginator.prev_num, per_page=per_page, expand=expand, _external=True,
-                                                   **kwargs) if paginator.has_prev else None,
-                "next_page_url": flask.url_for(flask.request.endpoint, page=paginator.next_num, per_page=per_page, expand=expand, _external=True,
-                                               **kwargs) if paginator.has_next else None,
-                "last_page_url": flask.url_for(flask.request.endpoint, page=paginator.pages, per_page=per_page, expand=expand, _external=True,
-                                               **kwargs),
-                "total_items": paginator.total,
-            }
+            "items": items,
+            "metadata": metadata
         }
     return wrapper
 
 
-@wrapt.decorator
-def add_etag(wrapped, instance, args, kwargs):
-    response = flask.make_response(wrapped(*args, **kwargs))
-    etag = '"%s"' % hashlib.md5(response.get_data()).hexdigest()
-    response.headers["ETag"] = etag
-    response.headers["Cache-Control"] = "max-age=86400"
+def _check_preconditions(etag):
     if_match = flask.request.headers.get("If-Match")
     if_none_match = flask.request.headers.get("If-None-Match")
     if if_match is not None and if_match != "*" and etag not in (tag.strip() for tag in if_match.split(",")):
         flask.abort(412)
-    elif if_none_match is not None and (if_none_match == "*" or etag in (tag.strip() for tag in if_none_match.split(", "))):
-        flask.abort(304)
-    return response
+    elif if_none_match is not None and (if_none_match == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+        # Werkzeug has no exception for 304 so the response is returned rather than aborting.
+        return flask.Response(status=304)
+    return None
+
+
+def add_etag(get_validator=None):
+    # If provided, get_validator is called with the view arguments and should cheaply return a string that changes whenever the response would,
+    # e.g. a version number. This allows the preconditions to be checked before the view is run rather than after the response is rendered.
+    @wrapt.decorator
+    def wrapper(wrapped, instance, args, kwargs):
+        if get_validator is not None:
+            with metrics.timer("convention_etag_duration_seconds"):
+                # Each representation needs its own ETag so the negotiated content type and encoding form part of the validator.
+                validator = "%s\n%s\n%s\n%s" % (flask.request.full_path, get_validator(*args, **kwargs), serialisers.get_mimetype(),
+                                                _get_content_encoding())
+                etag = '"%s"' % hashlib.md5(validator.encode("UTF-8")).hexdigest()
+                not_modified = _check_preconditions(etag)
+            response = not_modified or flask.make_response(wrapped(*args, **kwargs))
+        else:
+            # Without a validator the whole body, which may have been streamed, has to be buffered to be hashed.
+            response = flask.make_response(wrapped(*args, **kwargs))
+            with metrics.timer("convention_etag_duration_seconds"):
+                etag = '"%s"' % hashlib.md5(response.get_data()).hexdigest()
+                response = _check_preconditions(etag) or response
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "max-age=86400"
+        return response
+    return wrapper
+
+
+def _get_content_encoding():
+    return flask.request.accept_encodings.best_match(_COMPRESSION_WBITS)
+
+
+def _compress(chunks, encoding):
+    compressor = zlib.compressobj(wbits=_COMPRESSION_WBITS[encoding])
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
 
 
 @wrapt.decorator
 def to_json(wrapped, instance, args, kwargs):
+    # Despite the name, the response is MessagePack rather than JSON if the client prefers it.
     return_value = wrapped(*args, **kwargs)
     status = None
     headers = None
@@ -67,7 +175,27 @@ def to_json(wrapped, instance, args, kwargs):
             return_value, headers = return_value
     elif return_value is None:
         return_value = {}
-    response = flask.jsonify(return_value)
+    # Bodies that fit in a single chunk are sent as is whereas larger bodies are streamed as they are encoded rather than built up in memory.
+    # Either way, the body is compressed if the client accepts it and it is large enough to benefit.
+    mimetype = serialisers.get_mimetype()
+    encoding = _get_content_encoding()
+    with metrics.timer("convention_serialisation_duration_seconds"):
+        chunks = serialisers.iter_response(return_value, mimetype)
+        first_chunk = next(chunks)
+        second_chunk = next(chunks, None)
+    if second_chunk is None:
+        if encoding is not None and len(first_chunk) >= _MIN_COMPRESSION_SIZE:
+            first_chunk = b"".join(_compress((first_chunk, ), encoding))
+        else:
+            encoding = None
+        response = flask.Response(first_chunk, mimetype=mimetype)
+    else:
+        chunks = itertools.chain((first_chunk, second_chunk), chunks)
+        response = flask.Response(flask.stream_with_context(chunks if encoding is None else _compress(chunks, encoding)),
+                                  mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(("Accept", "Accept-Encoding"))
     if status is not None:
         response.status_code = int(status)
     if headers is not None:
@@ -1,11 +1,16 @@
+import os
+
 import convention
 import convention.views
 import convention.auth.views
 import convention.api.views
 import convention.users.views
-from convention import models
+from convention import migrations, sync
 
 
 if __name__ == "__main__":
-    models.db.create_all()
+    migrations.upgrade()
+    # When reloading, the parent process only watches for changes so the scheduler is started in the child that serves requests.
+    if convention.app.config["SYNC_ENABLED"] and (not convention.app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        sync.start()
     convention.app.run(threaded=True)
@@ -0,0 +1,154 @@
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+import flask
+import sqlalchemy
+
+import convention
+from convention import models
+
+
+_DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+_SLOW_REQUEST_SECONDS = convention.app.config["METRICS_SLOW_REQUEST_SECONDS"]
+
+_CACHES = {
+    "auth_tokens": models._auth_tokens,
+    "users": models._users,
+    "compiled_conventions": models._compiled_conventions,
+    "convention_data": models._convention_data,
+    "classifiers": models._classifiers,
+    "snapshots": models._snapshots,
+    "validation_results": models._validation_results
+}
+
+_HELP = collections.OrderedDict((
+    ("convention_requests_total", ("counter", "The number of requests handled.")),
+    ("convention_request_duration_seconds", ("histogram", "The time taken to handle a request, up to the response headers.")),
+    ("convention_request_queries", ("histogram", "The number of SQL queries issued per request.")),
+    ("convention_request_query_duration_seconds", ("histogram", "The time spent executing SQL queries per request.")),
+    ("convention_serialisation_duration_seconds", ("histogram", "The time spent serialising responses as JSON.")),
+    ("convention_etag_duration_seconds", ("histogram", "The time spent calculating ETags and checking preconditions.")),
+    ("convention_queries_total", ("counter", "The number of SQL queries issued, including those outside of requests.")),
+    ("convention_cache_hits_total", ("counter", "The number of cache hits.")),
+    ("convention_cache_misses_total", ("counter", "The number of cache misses.")),
+    ("convention_cache_items", ("gauge", "The number of items in a cache."))
+))
+
+_lock = threading.Lock()
+_counters = collections.Counter()
+_histograms = {}
+
+
+class _Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _get_labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    with _lock:
+        _counters[name, _get_labels(**labels)] += value
+
+
+def observe(name, value, buckets=_DURATION_BUCKETS, **labels):
+    key = (name, _get_labels(**labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+@contextlib.contextmanager
+def timer(name):
+    # Times the enclosed block against the current endpoint.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, endpoint=flask.request.endpoint or "")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (label, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+                             for label, value in labels)
+
+
+def render():
+    # Renders every metric in the Prometheus text exposition format.
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (histogram.buckets, list(histogram.counts), histogram.sum) for key, histogram in _histograms.items()}
+    for cache_name, cache in _CACHES.items():
+        labels = _get_labels(cache=cache_name)
+        counters["convention_cache_hits_total", labels] = cache.hits
+        counters["convention_cache_misses_total", labels] = cache.misses
+        counters["convention_cache_items", labels] = len(cache)
+    lines = []
+    for name, (metric_type, description) in _HELP.items():
+        lines.append("# HELP %s %s" % (name, description))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for (metric_name, labels), value in sorted(counters.items()):
+            if metric_name == name:
+                lines.append("%s%s %s" % (name, _format_labels(labels), value))
+        for (metric_name, labels), (buckets, counts, total) in sorted(histograms.items()):
+            if metric_name != name:
+                continue
+            cumulative = 0
+            for bucket, count in zip(buckets + ("+Inf", ), counts):
+                cumulative += count
+                lines.append("%s_bucket%s %s" % (name, _format_labels(labels + (("le", bucket), )), cumulative))
+            lines.append("%s_sum%s %s" % (name, _format_labels(labels), total))
+            lines.append("%s_count%s %s" % (name, _format_labels(labels), cumulative))
+    return "\n".join(lines) + "\n"
+
+
+@convention.app.before_request
+def _start_request():
+    flask.g.request_started = time.perf_counter()
+    flask.g.query_count = 0
+    flask.g.query_seconds = 0
+
+
+@convention.app.after_request
+def _finish_request(response):
+    # Streamed responses are still being generated at this point so only the time until the response headers is recorded for them.
+    duration = time.perf_counter() - flask.g.request_started
+    endpoint = flask.request.endpoint or ""
+    increment("convention_requests_total", endpoint=endpoint, method=flask.request.method, status=response.status_code)
+    observe("convention_request_duration_seconds", duration, endpoint=endpoint, method=flask.request.method)
+    observe("convention_request_queries", flask.g.query_count, _QUERY_COUNT_BUCKETS, endpoint=endpoint)
+    observe("convention_request_query_duration_seconds", flask.g.query_seconds, endpoint=endpoint)
+    if _SLOW_REQUEST_SECONDS is not None and duration >= _SLOW_REQUEST_SECONDS:
+        convention.app.logger.warning("Slow request: %s %s took %.3fs, of which %d SQL queries took %.3fs.", flask.request.method,
+                                      flask.request.full_path, duration, flask.g.query_count, flask.g.query_seconds)
+    return response
+
+
+@models.db.event.listens_for(sqlalchemy.engine.Engine, "before_cursor_execute")
+def _start_query(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@models.db.event.listens_for(sqlalchemy.engine.Engine, "after_cursor_execute")
+def _finish_query(connection, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - connection.info["query_started"].pop()
+    increment("convention_queries_total")
+    if flask.has_request_context() and "query_count" in flask.g:
+        flask.g.query_count += 1
+        flask.g.query_seconds += duration
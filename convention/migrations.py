@@ -0,0 +1,170 @@
+import collections
+import datetime
+import sys
+
+import sqlalchemy
+from sqlalchemy import schema
+
+import convention
+from convention import models
+
+
+_migrations = collections.OrderedDict()
+
+_applied_migrations = sqlalchemy.Table(
+    "SchemaMigration", sqlalchemy.MetaData(),
+    sqlalchemy.Column("MigrationName", sqlalchemy.String(100), primary_key=True),
+    sqlalchemy.Column("MigrationAppliedUTC", sqlalchemy.DateTime, nullable=False)
+)
+
+
+def _migration(name):
+    # Migrations are applied in the order that they are defined and must never be renamed or reordered once released.
+    def decorator(f):
+        _migrations[name] = f
+        return f
+    return decorator
+
+
+def _get_column_names(connection, table):
+    return {column["name"] for column in sqlalchemy.inspect(connection).get_columns(table.name)}
+
+
+def _get_index_names(connection, table):
+    return {index["name"] for index in sqlalchemy.inspect(connection).get_indexes(table.name)}
+
+
+def _add_column(connection, column):
+    # Databases created by create_all before migrations existed may or may not have the column already.
+    if column.name in _get_column_names(connection, column.table):
+        return
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+    ddl = "ALTER TABLE %s ADD COLUMN %s %s" % (preparer.format_table(column.table), preparer.format_column(column), column.type.compile(dialect))
+    if column.default is not None:
+        ddl += " DEFAULT %s" % sqlalchemy.literal(column.default.arg, column.type).compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    if not column.nullable:
+        ddl += " NOT NULL"
+    connection.execute(ddl)
+
+
+def _get_unique_column_names(connection, table):
+    inspector = sqlalchemy.inspect(connection)
+    return ({tuple(constraint["column_names"]) for constraint in inspector.get_unique_constraints(table.name)} |
+            {tuple(index["column_names"]) for index in inspector.get_indexes(table.name) if index["unique"]})
+
+
+def _add_unique_constraint(connection, constraint):
+    # SQLite cannot add constraints to an existing table but a unique index of the same name enforces the same thing. Some databases were
+    # created with an equivalent, unnamed, constraint which is left as it is.
+    if tuple(column.name for column in constraint.columns) in _get_unique_column_names(connection, constraint.table):
+        return
+    if connection.dialect.name == "sqlite":
+        preparer = connection.dialect.identifier_preparer
+        connection.execute("CREATE UNIQUE INDEX %s ON %s (%s)" % (preparer.quote(constraint.name), preparer.format_table(constraint.table),
+                                                                  ", ".join(preparer.format_column(column) for column in constraint.columns)))
+    else:
+        connection.execute(schema.AddConstraint(constraint))
+
+
+def _add_index(connection, index):
+    if index.name not in _get_index_names(connection, index.table):
+        index.create(connection)
+
+
+def _get_unique_constraint(table):
+    return next(constraint for constraint in table.constraints if isinstance(constraint, schema.UniqueConstraint))
+
+
+@_migration("0001_convention_version")
+def _add_convention_version(connection):
+    _add_column(connection, models.Convention.__table__.c.ConventionVersion)
+
+
+@_migration("0002_source")
+def _add_source(connection):
+    models.Source.__table__.create(connection, checkfirst=True)
+
+
+@_migration("0003_restriction_storage")
+def _add_restriction_storage(connection):
+    _add_column(connection, models.Convention.__table__.c.ConventionStorage)
+    _add_column(connection, models.Convention.__table__.c.ConventionRestrictions)
+
+
+@_migration("0004_restriction_indexes")
+def _add_restriction_indexes(connection):
+    # The unique constraints were never created, so any duplicate groups are merged into the first of them, and then any duplicate
+    # restrictions (including those that merging creates) are removed, before the constraints can be added.
+    groups = models.AllowableGroup.__table__
+    restrictions = models.Restriction.__table__
+    first_group_keys = {}
+    for key, number, name in connection.execute(sqlalchemy.select([groups.c.AllowableGroupKey, groups.c.AllowableGroupNumber,
+                                                                   groups.c.AllowableGroupName]).order_by(groups.c.AllowableGroupKey)):
+        first_key = first_group_keys.setdefault((number, name), key)
+        if first_key != key:
+            connection.execute(restrictions.update().where(restrictions.c.AllowableGroupKey == key).values(AllowableGroupKey=first_key))
+            connection.execute(groups.delete().where(groups.c.AllowableGroupKey == key))
+    first_restriction_keys = sqlalchemy.select([sqlalchemy.func.min(restrictions.c.RestrictionKey)]).group_by(
+        restrictions.c.ConventionKey, restrictions.c.AllowableGroupKey, restrictions.c.AllowableValueKey, restrictions.c.AllowableCombinationID)
+    connection.execute(restrictions.delete().where(restrictions.c.RestrictionKey.notin_(first_restriction_keys)))
+    _add_unique_constraint(connection, _get_unique_constraint(groups))
+    _add_unique_constraint(connection, _get_unique_constraint(restrictions))
+    for table in (restrictions, models.Convention.__table__):
+        for index in table.indexes:
+            _add_index(connection, index)
+
+
+@_migration("0005_convention_autoincrement")
+def _add_convention_autoincrement(connection):
+    # SQLite reuses the key of the last convention once it is deleted, which would give a new convention the cached data of the deleted one.
+    # A table cannot be altered to autoincrement so it is rebuilt. Other databases never reuse keys.
+    conventions = models.Convention.__table__
+    if connection.dialect.name != "sqlite" or "AUTOINCREMENT" in connection.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", conventions.name).scalar().upper():
+        return
+    metadata = sqlalchemy.MetaData()
+    models.User.__table__.tometadata(metadata)
+    rebuilt = conventions.tometadata(metadata, name="%s_rebuilt" % conventions.name)
+    connection.execute(schema.CreateTable(rebuilt))
+    connection.execute(rebuilt.insert().from_select(conventions.c.keys(), sqlalchemy.select(list(conventions.c))))
+    connection.execute(schema.DropTable(conventions))
+    preparer = connection.dialect.identifier_preparer
+    connection.execute("ALTER TABLE %s RENAME TO %s" % (preparer.format_table(rebuilt), preparer.format_table(conventions)))
+    for index in conventions.indexes:
+        _add_index(connection, index)
+
+
+@_migration("0006_user_conventions_version")
+def _add_user_conventions_version(connection):
+    _add_column(connection, models.User.__table__.c.UserConventionsVersion)
+
+
+def upgrade(engine=None):
+    # Brings the database up to date and returns the names of the migrations applied. A new database is created from the models, which are
+    # always current, so every migration is recorded as applied without being run. Otherwise, each migration that has not yet been applied is
+    # run in its own transaction.
+    engine = models.db.engine if engine is None else engine
+    with engine.begin() as connection:
+        is_new = not engine.dialect.has_table(connection, models.Convention.__tablename__)
+        _applied_migrations.create(connection, checkfirst=True)
+        applied = {row[0] for row in connection.execute(sqlalchemy.select([_applied_migrations.c.MigrationName]))}
+        if is_new:
+            models.db.Model.metadata.create_all(connection)
+    pending = [name for name in _migrations if name not in applied]
+    for name in pending:
+        with engine.begin() as connection:
+            if not is_new:
+                _migrations[name](connection)
+            connection.execute(_applied_migrations.insert().values(MigrationName=name, MigrationAppliedUTC=datetime.datetime.utcnow()))
+    return pending
+
+
+def main():
+    for name in upgrade():
+        print("Applied %s." % name, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    with convention.app.app_context():
+        main()
@@ -1,25 +1,142 @@
 import collections
 import datetime
-import fnmatch
+import functools
+import random
 import re
+import sqlite3
+import time
 
+from sqlalchemy import orm
 from werkzeug import security
+import flask
 import flask_login
 import flask_sqlalchemy
 import itsdangerous
+import sqlalchemy
 
 import convention
+from convention import snapshots, utilities, validation
 
 
 _SECRET_KEY = convention.app.config["SECRET_KEY"]
+_MAX_BOUND_PARAMETERS = 999
+_REPLICAS = convention.app.config["DATABASE_REPLICAS"]
+_READ_YOUR_WRITES_SECONDS = convention.app.config["DATABASE_READ_YOUR_WRITES_SECONDS"]
+_SQLITE_PRAGMAS = convention.app.config["SQLITE_PRAGMAS"]
+_SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+_PRIMARY_COOKIE_NAME = "convention_primary"
 
-db = flask_sqlalchemy.SQLAlchemy(convention.app)
+_recent_writers = utilities.LRUCache(convention.app.config["DATABASE_READ_YOUR_WRITES_CACHE_SIZE"], _READ_YOUR_WRITES_SECONDS)
+
+
+def _is_read_only_request():
+    # Requests from users who have written recently are not read only so that they read their own writes, rather than a lagging replica. This
+    # is remembered in the process and in a cookie, as the next request may be handled by another process.
+    if not flask.has_request_context():
+        return False
+    if not flask.g.get("read_only", flask.request.method in _SAFE_METHODS) or _PRIMARY_COOKIE_NAME in flask.request.cookies:
+        return False
+    user = flask.g.get("current_user")
+    return user is None or _recent_writers.get(user.key) is None
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    # Whilst handling a read only request, queries are sent to a randomly chosen replica, whereas everything else goes to the primary. Once a
+    # session has flushed, it keeps to the primary for the rest of the request so that it reads its own writes.
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing:
+            self.info["primary"] = True
+        elif _REPLICAS and not self.info.get("primary") and _is_read_only_request():
+            return db.get_engine(bind=random.choice(_REPLICAS))
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in _SQLITE_PRAGMAS.items():
+            cursor.execute("PRAGMA %s = %s" % (pragma, value))
+        cursor.close()
+
+
+class _SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        # The pragmas only apply to the engines of the primary and its replicas, not to any other engine in the process, e.g. those of SQL
+        # sources.
+        engine = super(_SQLAlchemy, self).create_engine(sa_url, engine_opts)
+        sqlalchemy.event.listen(engine, "connect", _configure_sqlite)
+        return engine
+
+
+db = _SQLAlchemy(convention.app)
+
+
+_REGEX_ENGINE = convention.app.config["REGEX_ENGINE"]
+_REGEX_STEP_BUDGET = convention.app.config["REGEX_STEP_BUDGET"]
+_MAX_NAME_LENGTH = convention.app.config["MAX_NAME_LENGTH"]
+_REJECT_SUPERLINEAR_PATTERNS = convention.app.config["REJECT_SUPERLINEAR_PATTERNS"]
+
+# Restrictions are either stored as a row per value, or combination cell, or as a single dictionary encoded blob per convention, which is far
+# more compact for conventions with many combinations.
+ROW_STORAGE = "rows"
+ARRAY_STORAGE = "array"
+STORAGES = (ROW_STORAGE, ARRAY_STORAGE)
+
+_auth_tokens = utilities.LRUCache(convention.app.config["AUTH_CACHE_SIZE"], convention.app.config["AUTH_CACHE_TTL"])
+_users = utilities.LRUCache(convention.app.config["AUTH_CACHE_SIZE"], convention.app.config["AUTH_CACHE_TTL"])
+_compiled_conventions = utilities.LRUCache(convention.app.config["COMPILED_CONVENTION_CACHE_SIZE"])
+_convention_data = utilities.LRUCache(convention.app.config["CONVENTION_DATA_CACHE_SIZE"])
+_classifiers = utilities.LRUCache(convention.app.config["CLASSIFIER_CACHE_SIZE"])
+_snapshots = utilities.LRUCache(convention.app.config["SNAPSHOT_CACHE_SIZE"])
+_validation_results = utilities.LRUCache(convention.app.config["VALIDATION_CACHE_SIZE"])
 
 
 class ConventionException(Exception):
     pass
 
 
+@functools.lru_cache()
+def _get_serialiser(expires_in=None):
+    return itsdangerous.TimedJSONWebSignatureSerializer(_SECRET_KEY, expires_in=expires_in)
+
+
+def _get_allowable_group_keys(groups):
+    # Groups are few so we fetch every group sharing a number with those required and match the (number, name) pairs in Python, which also
+    # sidesteps comparing nullable names in SQL.
+    def get_keys():
+        return {(number, name): key for key, number, name in db.session.query(AllowableGroup.key, AllowableGroup.number, AllowableGroup.name)
+                .filter(AllowableGroup.number.in_({number for number, _ in groups}))}
+
+    keys = get_keys()
+    missing = groups - keys.keys()
+    if missing:
+        db.session.execute(AllowableGroup.__table__.insert(), [{AllowableGroup.number.name: number, AllowableGroup.name.name: name}
+                                                               for number, name in missing])
+        keys = get_keys()
+    return keys
+
+
+def _get_allowable_value_keys(names):
+    def get_keys(names):
+        names = list(names)
+        keys = {}
+        # The batches keep each query within SQLite's limit on the number of bound parameters.
+        for index in range(0, len(names), _MAX_BOUND_PARAMETERS):
+            keys.update(db.session.query(AllowableValue.name, AllowableValue.key).filter(
+                AllowableValue.name.in_(names[index:index + _MAX_BOUND_PARAMETERS])))
+        return keys
+
+    keys = get_keys(names)
+    missing = names - keys.keys()
+    if missing:
+        db.session.execute(AllowableValue.__table__.insert(), [{AllowableValue.name.name: name} for name in missing])
+        keys.update(get_keys(missing))
+    return keys
+
+
 class User(db.Model, flask_login.UserMixin):
     __tablename__ = "User"
 
@@ -33,6 +150,20 @@ class User(db.Model, flask_login.UserMixin):
     last_name = db.Column("UserLastName", db.Unicode(35))
     avatar_url = db.Column("UserAvatarURL", db.Unicode(500))
     is_active = db.Column("UserIsActive", db.Boolean, default=True)
+    # Changes whenever any of the user's conventions is added, changed or deleted. It is random, rather than incremented, so that a version
+    # which is rolled back can never be reused for different conventions.
+    conventions_version = db.Column("UserConventionsVersion", db.Integer, default=0, nullable=False)
+
+    @property
+    def classifier(self):
+        # The classifier is rebuilt whenever the user's conventions version changes, which is far cheaper to read than the conventions.
+        version = db.session.query(User.conventions_version).filter(User.key == self.key).scalar()
+        entry = _classifiers.get(self.key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        classifier = validation.Classifier((c.key, c.compiled) for c in Convention.query.filter_by(user=self).order_by(Convention.key))
+        _classifiers.set(self.key, (version, classifier))
+        return classifier
 
     @property
     def password(self):
@@ -46,18 +177,37 @@ class User(db.Model, flask_login.UserMixin):
     def registered(self):
         return self.password_hash is not None
 
+    @staticmethod
+    def load(user_key):
+        # Users are cached as column values rather than instances as instances are bound to the session of the request that loaded them. A
+        # cached user is rebuilt as a detached instance and merged into the current session without emitting any SQL.
+        values = _users.get(user_key)
+        if values is None:
+            user = User.query.get(user_key)
+            if user is not None:
+                _users.set(user_key, {attribute.key: getattr(user, attribute.key) for attribute in User.__mapper__.column_attrs})
+            return user
+        user = User(**values)
+        db.make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
     @staticmethod
     def verify_auth_token(token):
-        serialiser = itsdangerous.TimedJSONWebSignatureSerializer(_SECRET_KEY)
-        try:
-            data = serialiser.loads(token)
-        except (itsdangerous.BadSignature, itsdangerous.SignatureExpired):
-            return None
-        return User.query.get(data["UserKey"])
+        user_key = _auth_tokens.get(token)
+        if user_key is None:
+            try:
+                data, header = _get_serialiser().loads(token, return_header=True)
+            except (itsdangerous.BadSignature, itsdangerous.SignatureExpired):
+                return None
+            user_key = data["UserKey"]
+            # A verified token is only trusted for as long as it would have remained valid.
+            ttl = header["exp"] - time.time()
+            _auth_tokens.set(token, user_key, ttl if _auth_tokens.ttl is None else min(ttl, _auth_tokens.ttl))
+        user = User.load(user_key)
+        return user if user is not None and user.is_active else None
 
     def generate_auth_token(self, expires_in=3600):
-        serialiser = itsdangerous.TimedJSONWebSignatureSerializer(_SECRET_KEY, expires_in=expires_in)
-        return serialiser.dumps({"UserKey": self.key}).decode("UTF-8")
+        return _get_serialiser(expires_in).dumps({"UserKey": self.key}).decode("UTF-8")
 
     def get_id(self):
         return self.key
@@ -66,6 +216,13 @@ class User(db.Model, flask_login.UserMixin):
         return security.check_password_hash(self.password_hash, password)
 
 
+@db.event.listens_for(User, "after_delete")
+@db.event.listens_for(User, "after_update")
+def _invalidate_user(mapper, connection, target):
+    # Any change to a user, e.g. deactivation or a new password, evicts the cached copy so it is reloaded on next use.
+    _users.pop(target.key)
+
+
 class AllowableGroup(db.Model):
     __tablename__ = "AllowableGroup"
 
@@ -73,7 +230,7 @@ class AllowableGroup(db.Model):
     number = db.Column("AllowableGroupNumber", db.Integer, nullable=False)
     name = db.Column("AllowableGroupName", db.Unicode(50))
 
-    __tableargs__ = (db.UniqueConstraint(number, name), )
+    __table_args__ = (db.UniqueConstraint(number, name, name="UQ_AllowableGroup"), )
 
 
 class AllowableValue(db.Model):
@@ -87,33 +244,115 @@ class Convention(db.Model):
     __tablename__ = "Convention"
 
     key = db.Column("ConventionKey", db.Integer, primary_key=True)
-    user_key = db.Column("UserKey", db.Integer, db.ForeignKey(User.key), nullable=False)
+    user_key = db.Column("UserKey", db.Integer, db.ForeignKey(User.key), index=True, nullable=False)
     name = db.Column("ConventionName", db.String(50), nullable=False)
     combinations_restricted = db.Column("ConventionCombinationsRestricted", db.Boolean, nullable=False)
     _is_regex = db.Column("ConventionIsRegex", db.Boolean)
     _pattern = db.Column("ConventionPattern", db.String(1000), nullable=False)
+    version = db.Column("ConventionVersion", db.Integer, default=1, nullable=False)
+    storage = db.Column("ConventionStorage", db.String(10), default=ROW_STORAGE, nullable=False)
+    _restrictions_blob = db.deferred(db.Column("ConventionRestrictions", db.LargeBinary))
+
+    # Derived data is cached by key so SQLite must never reuse the key of a deleted convention.
+    __table_args__ = {"sqlite_autoincrement": True}
 
     user = db.relationship(User)
     restrictions = db.relationship(lambda: Restriction, lazy="dynamic", cascade="all, delete, delete-orphan")
+    sources = db.relationship(lambda: Source, back_populates="convention", cascade="all, delete, delete-orphan")
 
-    def __init__(self, name, user, pattern, is_regex, values=None, combinations=None, combinations_restricted=None):
+    def __init__(self, name, user, pattern, is_regex, values=None, combinations=None, combinations_restricted=None, storage=None):
         self.name = name
         self.user = user
+        self.storage = storage or convention.app.config["DEFAULT_CONVENTION_STORAGE"]
+        if self.storage not in STORAGES:
+            raise ConventionException("The storage must be one of: %s." % ", ".join(STORAGES))
         self.set_pattern(pattern, is_regex, values, combinations, combinations_restricted)
 
     @flask_sqlalchemy.orm.reconstructor
     def _init_on_load(self):
-        self._regex = re.compile(fnmatch.translate(self._pattern) if not self._is_regex else self._pattern)
-
-    def _add_restrictions(self, group_number, group_name, *values, combination_ID=None):
-        for value in values:
-            restriction = Restriction(combination_ID=combination_ID)
-            restriction.allowable_value = db.session.query(AllowableValue).filter_by(name=value).first() or AllowableValue(name=value)
-            restriction.allowable_group = (db.session.query(AllowableGroup).filter_by(number=group_number, name=group_name).first() or
-                                           AllowableGroup(number=group_number, name=group_name))
-            db.session.add(restriction.allowable_value)
-            db.session.add(restriction.allowable_group)
-            self.restrictions.append(restriction)
+        self._regex = validation.compile_pattern(self._pattern, self._is_regex)
+        self._compiled = None
+
+    def _replace_restrictions(self, restrictions):
+        # Restrictions are written in bulk rather than through the ORM as conventions may have hundreds of thousands of them. Each restriction is
+        # a (group number, group name, value, combination ID) tuple.
+        self._bump_version()
+        if self.storage == ARRAY_STORAGE:
+            self._write_blob(restrictions)
+            return
+        if self.key is None:
+            if not restrictions:
+                return
+            db.session.add(self)
+            db.session.flush()
+        else:
+            Restriction.query.filter_by(convention_key=self.key).delete(synchronize_session=False)
+        if restrictions:
+            self._insert_restrictions(restrictions)
+        self._compiled = validation.CompiledConvention(self._pattern, self._is_regex, self.combinations_restricted, (
+            (group_number, value, combination_ID) for group_number, _, value, combination_ID in restrictions), self.version, _REGEX_ENGINE,
+            _REGEX_STEP_BUDGET, _MAX_NAME_LENGTH)
+
+    def _insert_restrictions(self, restrictions):
+        group_keys = _get_allowable_group_keys({(group_number, group_name) for group_number, group_name, _, _ in restrictions})
+        value_keys = _get_allowable_value_keys({value for _, _, value, _ in restrictions})
+        # The column names are resolved once up front as instrumented attribute access is too slow to repeat for every row.
+        convention_key_column, allowable_value_key_column, allowable_group_key_column, combination_ID_column = (
+            column.name for column in (Restriction.convention_key, Restriction.allowable_value_key, Restriction.allowable_group_key,
+                                       Restriction.combination_ID))
+        db.session.execute(Restriction.__table__.insert(), [{
+            convention_key_column: self.key,
+            allowable_value_key_column: value_keys[value],
+            allowable_group_key_column: group_keys[group_number, group_name],
+            combination_ID_column: combination_ID
+        } for group_number, group_name, value, combination_ID in restrictions])
+
+    def _write_blob(self, restrictions):
+        group_names = {v: k for k, v in self._regex.groupindex.items()}  # Reverse the groupindex mapping
+        self._restrictions_blob = snapshots.dumps([group_names.get(number) for number in range(1, self._regex.groups + 1)], [
+            (group_number, value, combination_ID) for group_number, _, value, combination_ID in restrictions]) if restrictions else None
+
+    def _bump_version(self):
+        self.version = (self.version or 0) + 1
+        self._compiled = None
+        # The changes may be flushed, and so no longer appear modified, well before they are committed.
+        db.session.info.setdefault("bumped_conventions", set()).add(self)
+
+    def _is_committed(self):
+        return self.key is not None and self not in db.session.info.get("bumped_conventions", ()) and not db.session.is_modified(self)
+
+    def _compile(self):
+        return validation.CompiledConvention(self._pattern, self._is_regex, self.combinations_restricted, self._get_restrictions(), self.version,
+                                             _REGEX_ENGINE, _REGEX_STEP_BUDGET, _MAX_NAME_LENGTH)
+
+    def _get_restrictions(self):
+        # Returns the (group number, value, combination ID) restrictions. A convention that has not been flushed cannot have any restrictions in
+        # the database.
+        if self.storage == ARRAY_STORAGE:
+            return () if self._restrictions_blob is None else snapshots.iter_blob_restrictions(self._restrictions_blob)
+        if self.key is None:
+            return ()
+        return self.restrictions.join(Restriction.allowable_group, Restriction.allowable_value).with_entities(
+            AllowableGroup.number, AllowableValue.name, Restriction.combination_ID)
+
+    def _get_cached(self, cache, build):
+        # Derived data is cached against the convention version so any change to the pattern or restrictions invalidates it. Uncommitted
+        # changes may yet be rolled back so only data that matches the database is shared with other requests.
+        entry = cache.get(self.key)
+        if entry is not None and entry[0] == self.version:
+            return entry[1]
+        value = build()
+        if self._is_committed():
+            cache.set(self.key, (self.version, value))
+        return value
+
+    @property
+    def compiled(self):
+        # The version is read first as reading an expired version reloads the convention, which discards the compiled convention.
+        version = self.version
+        if self._compiled is None or self._compiled.version != version:
+            self._compiled = self._get_cached(_compiled_conventions, self._compile)
+        return self._compiled
 
     @property
     def is_regex(self):
@@ -127,31 +366,50 @@ class Convention(db.Model):
     def pattern(self, value):
         raise AttributeError("The 'pattern' property is not directly writable. Please use the 'set_pattern' method instead.")
 
-    def get_data(self):
-        if self.combinations_restricted:
-            allowables = collections.defaultdict(dict)
+    def _serialise(self):
+        allowables = collections.defaultdict(dict if self.combinations_restricted else list)
+        restrictions = ()
+        if self.storage == ARRAY_STORAGE:
+            group_names = {v: k for k, v in self._regex.groupindex.items()}  # Reverse the groupindex mapping
+            restrictions = ((combination_ID, group_number, group_names.get(group_number), value) for group_number, value, combination_ID
+                            in self._get_restrictions() if (combination_ID is not None) == self.combinations_restricted)
+        elif self.key is not None:
             # Despite combinations_restricted being True, we cannot assume that the restrictions will have a combination ID as the user could have
-            # explicitly set combinations_restricted to True whilst restricting values only.
-            for restriction in self.restrictions.filter(Restriction.combination_ID.isnot(None)):
-                key = restriction.allowable_group.number + (" - " + restriction.allowable_group.name if restriction.allowable_group.name else "")
-                allowables[restriction.combination_ID][key] = restriction.allowable_value.name
-            label = "Allowable Combinations"
-        else:
-            allowables = collections.defaultdict(list)
-            # Similar to the above scenario, we cannot assume that the combinations aren't restricted.
-            for restriction in self.restrictions.filter(Restriction.combination_ID.is_(None)):
-                key = restriction.allowable_group.number + (" - " + restriction.allowable_group.name if restriction.allowable_group.name else "")
-                allowables[key].append(restriction.allowable_value.name)
-            label = "Allowable Values"
+            # explicitly set combinations_restricted to True whilst restricting values only. Similarly, we cannot assume that the combinations
+            # aren't restricted when combinations_restricted is False.
+            restrictions = db.session.query(Restriction.combination_ID, AllowableGroup.number, AllowableGroup.name, AllowableValue.name).join(
+                Restriction.allowable_group, Restriction.allowable_value).filter(
+                Restriction.convention_key == self.key, Restriction.combination_ID.isnot(None) if self.combinations_restricted else
+                Restriction.combination_ID.is_(None)).order_by(Restriction.key)
+        for combination_ID, group_number, group_name, value in restrictions:
+            key = "%s - %s" % (group_number, group_name) if group_name else str(group_number)
+            if self.combinations_restricted:
+                allowables[combination_ID][key] = value
+            else:
+                allowables[key].append(value)
         return {
             Convention.key.name: str(self.key),
-            User.email.name: self.user.email,
             Convention.name.name: self.name,
             Convention._pattern.name: self._pattern,
             Convention.combinations_restricted.name: self.combinations_restricted,
-            label: allowables
+            "Allowable Combinations" if self.combinations_restricted else "Allowable Values": allowables
         }
 
+    def get_data(self):
+        # The cached data is shared between requests so must not be modified. It is only invalidated by the convention version, so the owner's
+        # details are added to a copy of it instead of being cached.
+        data = dict(self._get_cached(_convention_data, self._serialise))
+        data[User.email.name] = self.user.email
+        return data
+
+    def get_snapshot(self):
+        # The returned snapshot is shared between requests so must not be modified.
+        if self.storage == ARRAY_STORAGE and self._restrictions_blob is not None:
+            return self._get_cached(_snapshots, lambda: snapshots.encode_blob(self._pattern, self._is_regex, self.combinations_restricted,
+                                                                              self._restrictions_blob, self.version, self.key))
+        return self._get_cached(_snapshots, lambda: snapshots.encode(self._pattern, self._is_regex, self.combinations_restricted,
+                                                                     self._get_restrictions(), self.version, self.key))
+
     def set_restrictions(self, values=None, combinations=None, combinations_restricted=None):
         pattern_named_groups = self._regex.groupindex.items()
         group_names = {v: k for k, v in pattern_named_groups}  # Reverse the groupindex mapping
@@ -161,14 +419,14 @@ class Convention(db.Model):
             # The user has provided new values so we need to check that they fit the pattern structure.
             if len(values) > self._regex.groups:
                 raise ConventionException("More groups of allowable values were provided than capturing groups in the pattern.")
-            self.restrictions = []  # New values overwrite existing restrictions
-            for index, values in enumerate(values):
-                group_number = index + 1
-                self._add_restrictions(group_number, group_names.get(group_number), *values)
             self.combinations_restricted = False
+            # New values overwrite existing restrictions. Repeated values are dropped as UQ_Restriction cannot catch them, since the NULL
+            # combination IDs of value restrictions are all distinct.
+            self._replace_restrictions([(index + 1, group_names.get(index + 1), value, None) for index, group_values in enumerate(values)
+                                        for value in set(group_values)])
             return
         elif combinations is None:
-            if self.restrictions is not None:
+            if self.key is not None and self.restrictions.first() is not None:
                 # The user has not provided any new values or combinations but we need to ensure that any existing restrictions fit the new pattern.
                 # Specifically, we check that the existing named groups still feature in the new pattern, and with the same group index.
                 if all(row in pattern_named_groups for row in self.restrictions.join(Restriction.allowable_group).filter(
@@ -185,61 +443,184 @@ class Convention(db.Model):
                     if ((combinations_exist and group_count == self._regex.groups) or (not combinations_exist and group_count <= self._regex.groups)):
                         return
                 raise ConventionException("The changes to the pattern break the restrictions. Please provide new restrictions to 'set_pattern'.")
+            elif self.storage == ARRAY_STORAGE and self._restrictions_blob is not None:
+                # The same checks as above but against the group names and dictionaries held in the blob.
+                header, data, _ = snapshots.loads(self._restrictions_blob)
+                restricted_groups = [(name, number) for number, (name, values) in enumerate(zip(header["groups"], header["values"]), 1) if values]
+                if all(name is None or (name, number) in pattern_named_groups for name, number in restricted_groups):
+                    group_count = max(number for _, number in restricted_groups)
+                    if (data and len(header["groups"]) == self._regex.groups) or (not data and group_count <= self._regex.groups):
+                        return
+                raise ConventionException("The changes to the pattern break the restrictions. Please provide new restrictions to 'set_pattern'.")
+            elif self.combinations_restricted is None:
+                self.combinations_restricted = bool(combinations_restricted)
             return
         group_count = len(combinations[0])
         if not all(len(combination) == group_count for combination in combinations):
             raise ConventionException("The number of groups were inconsistent amongst the combinations.")
         if group_count != self._regex.groups:
             raise ConventionException("The number of groups in the combinations was different to the number of capturing groups in the pattern.")
-        self.restrictions = []  # New combinations overwrite existing restrictions
-        for combination_index, combination in enumerate(combinations):
-            for index, value in enumerate(combination):
-                group_number = index + 1
-                self._add_restrictions(group_number, group_names.get(group_number), value, combination_ID=combination_index + 1)
         self.combinations_restricted = True if combinations_restricted is None else combinations_restricted
+        # New combinations overwrite existing restrictions
+        self._replace_restrictions([(index + 1, group_names.get(index + 1), value, combination_index + 1)
+                                    for combination_index, combination in enumerate(combinations) for index, value in enumerate(combination)])
 
     def set_pattern(self, pattern, is_regex, values=None, combinations=None, combinations_restricted=None):
+        # Patterns that re could take super-linear time to match are only accepted if they can be matched by the linear engine instead, which
+        # does not support every construct, unless they are rejected outright.
+        try:
+            regex = validation.compile_pattern(pattern, is_regex)
+        except re.error as e:
+            raise ConventionException("The pattern is invalid: %s." % e)
+        constructs = validation.get_superlinear_constructs(regex)
+        if constructs and (_REJECT_SUPERLINEAR_PATTERNS or _REGEX_ENGINE == "re" or not validation.LinearMatcher.supports(regex)):
+            raise ConventionException("The pattern could take super-linear time to match (%s)." % "; ".join(constructs))
         self._pattern = pattern
         self._is_regex = is_regex
         self._init_on_load()
+        self._bump_version()
         if is_regex:
             self.set_restrictions(values, combinations, combinations_restricted)
         else:
             # The user has explicitly opted for the basic wildcard pattern which does not support capturing groups so any existing restrictions can
             # be forgotten.
-            self.restrictions = []
             self.combinations_restricted = False
+            self._replace_restrictions([])
+
+    def update_restrictions(self, add_values=None, remove_values=None, add_combinations=None, remove_combinations=None):
+        # Unlike set_restrictions, only the given values or combinations are added or removed so only the affected rows are written and existing
+        # combinations keep their IDs. Values are given per group in the same way as set_restrictions and removals are applied before additions.
+        # The compiled convention is used to work out which values or combinations already exist without reading every restriction.
+        if (add_values or remove_values) and (add_combinations or remove_combinations):
+            raise ConventionException("Values and combinations cannot both be updated.")
+        compiled = self.compiled
+        group_names = {v: k for k, v in self._regex.groupindex.items()}  # Reverse the groupindex mapping
+        restricted = any(allowed is not None for allowed in compiled.values)
+        combinations_exist = bool(compiled.combination_IDs)
+        removed_values = set()
+        removed_combination_IDs = set()
+        additions = []
+        if add_values or remove_values:
+            if combinations_exist:
+                raise ConventionException("Individual values cannot be updated as the convention restricts combinations.")
+            if len(add_values or ()) > self._regex.groups or len(remove_values or ()) > self._regex.groups:
+                raise ConventionException("More groups of allowable values were provided than capturing groups in the pattern.")
+            removed_values = {(index + 1, value) for index, group_values in enumerate(remove_values or ()) for value in group_values
+                              if compiled.values[index] is not None and value in compiled.values[index]}
+            additions = [(index + 1, group_names.get(index + 1), value, None) for index, group_values in enumerate(add_values or ())
+                         for value in set(group_values) if compiled.values[index] is None or value not in compiled.values[index] or
+                         (index + 1, value) in removed_values]
+            # A group without any values is unrestricted, so removing all of a group's values would silently allow any value instead.
+            for index, allowed in enumerate(compiled.values):
+                if (allowed is not None and allowed <= {value for number, value in removed_values if number == index + 1} and
+                        not any(number == index + 1 for number, _, _, _ in additions)):
+                    raise ConventionException("Removing every allowable value of group %d would lift its restriction. Please use "
+                                              "'set_restrictions' instead." % (index + 1))
+            if not restricted:
+                self.combinations_restricted = False
+        elif add_combinations or remove_combinations:
+            if restricted and not combinations_exist:
+                raise ConventionException("Combinations cannot be updated as the convention restricts values only.")
+            if not all(len(combination) == self._regex.groups for combination in (add_combinations or []) + (remove_combinations or [])):
+                raise ConventionException("The number of groups in the combinations was different to the number of capturing groups in the pattern.")
+            removed_combination_IDs = {combination_ID for combination in remove_combinations or ()
+                                       for combination_ID in compiled.get_combination_IDs(combination)}
+            next_combination_ID = max(compiled.combination_IDs or [0]) + 1
+            added_combinations = set()
+            for combination in add_combinations or ():
+                combination = tuple(combination)
+                if combination in added_combinations or set(compiled.get_combination_IDs(combination)) - removed_combination_IDs:
+                    continue
+                added_combinations.add(combination)
+                additions.extend((index + 1, group_names.get(index + 1), value, next_combination_ID) for index, value in enumerate(combination))
+                next_combination_ID += 1
+            if not restricted:
+                self.combinations_restricted = True
+        if not (additions or removed_values or removed_combination_IDs):
+            return
+        self._bump_version()
+        if self.storage == ARRAY_STORAGE:
+            # The blob is rewritten as a whole so the remaining restrictions are read back out of it.
+            self._write_blob([(group_number, group_names.get(group_number), value, combination_ID)
+                              for group_number, value, combination_ID in self._get_restrictions()
+                              if (group_number, value) not in removed_values and combination_ID not in removed_combination_IDs] + additions)
+            return
+        if self.key is None:
+            db.session.add(self)
+            db.session.flush()
+        for group_number in {group_number for group_number, _ in removed_values}:
+            values = [value for number, value in removed_values if number == group_number]
+            for index in range(0, len(values), _MAX_BOUND_PARAMETERS):
+                Restriction.query.filter(
+                    Restriction.convention_key == self.key, Restriction.combination_ID.is_(None),
+                    Restriction.allowable_group_key.in_(db.session.query(AllowableGroup.key).filter(AllowableGroup.number == group_number)),
+                    Restriction.allowable_value_key.in_(db.session.query(AllowableValue.key).filter(
+                        AllowableValue.name.in_(values[index:index + _MAX_BOUND_PARAMETERS])))).delete(synchronize_session=False)
+        removed_combination_IDs = list(removed_combination_IDs)
+        for index in range(0, len(removed_combination_IDs), _MAX_BOUND_PARAMETERS):
+            Restriction.query.filter(Restriction.convention_key == self.key, Restriction.combination_ID.in_(
+                removed_combination_IDs[index:index + _MAX_BOUND_PARAMETERS])).delete(synchronize_session=False)
+        if additions:
+            self._insert_restrictions(additions)
+
+    def set_storage(self, storage):
+        if storage not in STORAGES:
+            raise ConventionException("The storage must be one of: %s." % ", ".join(STORAGES))
+        if storage == self.storage:
+            return
+        group_names = {v: k for k, v in self._regex.groupindex.items()}  # Reverse the groupindex mapping
+        restrictions = [(group_number, group_names.get(group_number), value, combination_ID)
+                        for group_number, value, combination_ID in self._get_restrictions()]
+        if self.storage == ROW_STORAGE and self.key is not None:
+            Restriction.query.filter_by(convention_key=self.key).delete(synchronize_session=False)
+        self.storage = storage
+        self._restrictions_blob = None
+        self._replace_restrictions(restrictions)
 
     def validate(self, s):
-        match = self._regex.match(s)
-        if match is None:
-            return False
-        # We know that the input matches the pattern but we now need to test that any values passed to capturing groups are allowable.
-        groups = match.groups()
-        if self.combinations_restricted:
-            combination_IDs = collections.Counter()
-            for index in range(self._regex.groups):
-                group_number = index + 1
-                value = groups[group_number] or None
-                # For each value captured by a group, we look for combination IDs that allow that value and add them to a counter object which will
-                # keep track of the amount of times that combination ID has occured.
-                combination_IDs.update(self.restrictions.join(Restriction.allowable_value, Restriction.allowable_group)
-                                       .filter(AllowableGroup.number == group_number, AllowableValue.name == value)
-                                       .with_entities(Restriction.combination_ID).all())
-            # We then take the combination_ID that occured most and see if the number of occurences matches the number of capturing groups in the
-            # pattern. If so, we know that all the captured values were a valid combination.
-            return (0 if not combination_IDs else combination_IDs.most_common(1)[0][1]) == len(groups)
-        if self.restrictions is not None:
-            for index in range(self._regex.groups):
-                group_number = index + 1
-                value = groups[group_number] or None
-                # In the case of value-only restrictions, we need to check that the captured value is valid, but only if the group itself is
-                # restricted. We determine this by looking to see if there is at least one restriction for the group.
-                if (self.restrictions.join(Restriction.allowable_group).filter(AllowableGroup.number == group_number).first()
-                        is not None and self.restrictions.join(Restriction.allowable_group, Restriction.allowable_value)
-                        .filter(AllowableGroup.number == group_number, AllowableValue.name == value).first() is None):
-                    return False
-        return True
+        # Results are memoised against the convention version so that a change to the pattern or restrictions makes any earlier results
+        # unreachable, leaving them to be evicted as they age. As with _get_cached, only results that match the database are shared.
+        memo_key = (self.key, self.version, s)
+        result = _validation_results.get(memo_key)
+        if result is None:
+            result = self.compiled.validate(s)
+            if self._is_committed():
+                _validation_results.set(memo_key, result)
+        return result
+
+
+@db.event.listens_for(db.session, "after_transaction_end")
+def _forget_bumped_conventions(session, transaction):
+    # Once the outermost transaction is committed or rolled back, the database matches the conventions again.
+    if transaction.parent is None:
+        session.info.pop("bumped_conventions", None)
+
+
+@db.event.listens_for(Convention, "after_delete")
+def _evict_convention(mapper, connection, target):
+    # The cached data of a deleted convention is unreachable so is evicted rather than left to age out.
+    for cache in (_compiled_conventions, _convention_data, _snapshots):
+        cache.pop(target.key)
+    _validation_results.pop_where(lambda memo_key: memo_key[0] == target.key)
+
+
+@db.event.listens_for(Convention, "after_insert")
+@db.event.listens_for(Convention, "after_update")
+@db.event.listens_for(Convention, "after_delete")
+def _bump_conventions_version(mapper, connection, target):
+    # The last updated time is kept as it is, rather than being set by its onupdate, as the user has not changed.
+    users = User.__table__
+    connection.execute(users.update().where(users.c.UserKey == target.user_key).values({
+        users.c.UserConventionsVersion: random.getrandbits(31),
+        users.c.UserLastUpdatedUTC: users.c.UserLastUpdatedUTC
+    }))
+
+
+@db.event.listens_for(Convention, "refresh")
+def _recompile_pattern(target, context, attrs):
+    # The pattern may have been expired, e.g. by a rollback, so the compiled pattern is rebuilt whenever it is reloaded.
+    if attrs is None or {Convention._pattern.key, Convention._is_regex.key} & set(attrs):
+        target._init_on_load()
 
 
 class Restriction(db.Model):
@@ -254,4 +635,48 @@ class Restriction(db.Model):
     allowable_value = db.relationship(AllowableValue)
     allowable_group = db.relationship(AllowableGroup)
 
-    __tableargs__ = (db.UniqueConstraint(key, allowable_value_key, allowable_group_key, combination_ID), )
+    # The unique constraint leads with the convention so that its index covers reading a convention's restrictions, and removing values, without
+    # touching the table. Removing combinations filters on the combination ID instead.
+    __table_args__ = (db.UniqueConstraint(convention_key, allowable_group_key, allowable_value_key, combination_ID, name="UQ_Restriction"),
+                      db.Index("IX_Restriction_Combination", convention_key, combination_ID))
+
+
+class Source(db.Model):
+    __tablename__ = "Source"
+
+    key = db.Column("SourceKey", db.Integer, primary_key=True)
+    convention_key = db.Column("ConventionKey", db.Integer, db.ForeignKey(Convention.key), nullable=False)
+    group_number = db.Column("SourceGroupNumber", db.Integer, nullable=False)
+    adapter = db.Column("SourceAdapter", db.String(20), nullable=False)
+    location = db.Column("SourceLocation", db.Unicode(1000), nullable=False)
+    argument = db.Column("SourceArgument", db.Unicode(1000))
+    interval = db.Column("SourceIntervalSeconds", db.Integer, default=86400, nullable=False)
+    last_synced_utc = db.Column("SourceLastSyncedUTC", db.DateTime)
+
+    convention = db.relationship(Convention, back_populates="sources")
+
+    @staticmethod
+    def get_due():
+        now = datetime.datetime.utcnow()
+        return [source for source in Source.query if source.last_synced_utc is None or
+                source.last_synced_utc + datetime.timedelta(seconds=source.interval) <= now]
+
+
+def preload():
+    # Compiles conventions, and builds each user's classifier, into the caches ahead of any request, e.g. so that forked worker processes all
+    # start with (and share the memory of) warm caches. Users are loaded until the compiled convention cache is full.
+    for user in User.query.filter(User.key.in_(db.session.query(Convention.user_key))).order_by(User.key):
+        if len(_compiled_conventions) >= _compiled_conventions.max_size:
+            break
+        user.classifier
+    db.session.remove()
+
+
+@convention.app.after_request
+def _remember_writer(response):
+    if _REPLICAS and not flask.g.get("read_only", flask.request.method in _SAFE_METHODS):
+        user = flask.g.get("current_user")
+        if user is not None and user.is_authenticated:
+            _recent_writers.set(user.key, True)
+        response.set_cookie(_PRIMARY_COOKIE_NAME, "1", max_age=_READ_YOUR_WRITES_SECONDS, httponly=True)
+    return response
@@ -0,0 +1,188 @@
+import itertools
+import operator
+
+import flask
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/vnd.msgpack", "application/x-msgpack")
+
+_CHUNK_SIZE = 65536
+_MAX_PART_LENGTH = 1000
+_CONTAINERS = (dict, list, tuple)
+
+
+def _is_small(value):
+    # This is called for every item of a large container so map is used to avoid the overhead of a generator expression.
+    if isinstance(value, _CONTAINERS):
+        return len(value) <= _MAX_PART_LENGTH and not any(map(isinstance, value.values() if isinstance(value, dict) else value,
+                                                              itertools.repeat(_CONTAINERS)))
+    return True
+
+
+def _is_string_or_integer(key):
+    return isinstance(key, str) or (isinstance(key, int) and not isinstance(key, bool))
+
+
+def _iter_chunks(parts):
+    # The encoders yield many small parts so they are joined into chunks.
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= _CHUNK_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def _iter_json_parts(value, encode, sort_key):
+    # Large containers are generated incrementally, a batch of small items at a time, so that the body is never held in memory as a whole.
+    # Each batch is encoded as a container in its own right by the (much faster) C encoder and its brackets are then stripped. Items that are
+    # themselves large are generated recursively, although only string and integer keys can be converted in the same way as the encoder
+    # does, so large items under any other key are encoded in one go. If keys are sorted, sort_key must order them as the encoder does.
+    if _is_small(value):
+        yield encode(value)
+        return
+    is_dict = isinstance(value, dict)
+    separator = b""
+    batch = []
+    yield b"{" if is_dict else b"["
+    for item in (value.items() if sort_key is None else sorted(value.items(), key=sort_key)) if is_dict else value:
+        if not _is_small(item[1] if is_dict else item) and (not is_dict or _is_string_or_integer(item[0])):
+            if batch:
+                yield separator + encode(dict(batch) if is_dict else batch)[1:-1]
+                separator = b","
+                batch = []
+            if is_dict:
+                yield separator + encode(str(item[0])) + b":"
+            else:
+                yield separator
+            yield from _iter_json_parts(item[1] if is_dict else item, encode, sort_key)
+            separator = b","
+            continue
+        batch.append(item)
+        if len(batch) == _MAX_PART_LENGTH:
+            yield separator + encode(dict(batch) if is_dict else batch)[1:-1]
+            separator = b","
+            batch = []
+    if batch:
+        yield separator + encode(dict(batch) if is_dict else batch)[1:-1]
+    yield b"}" if is_dict else b"]"
+
+
+def iter_json(value):
+    # Encodes in the same way as flask.jsonify but incrementally. If orjson is installed, it is used in place of the standard library's
+    # encoder, in which case non-ASCII characters are encoded as UTF-8 rather than escaped and keys are sorted as strings. Pretty printed
+    # output, as is used for debugging, is left to the slower but indentation aware iterencode.
+    app = flask.current_app
+    pretty = app.config["JSONIFY_PRETTYPRINT_REGULAR"] or app.debug
+    encoder = app.json_encoder(ensure_ascii=app.config["JSON_AS_ASCII"], sort_keys=app.config["JSON_SORT_KEYS"], indent=2 if pretty else None,
+                               separators=(", ", ": ") if pretty else (",", ":"))
+    if pretty:
+        parts = (part.encode("UTF-8") for part in encoder.iterencode(value))
+    elif orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if encoder.sort_keys else 0)
+        parts = _iter_json_parts(value, lambda value: orjson.dumps(value, default=encoder.default, option=option),
+                                 (lambda item: str(item[0])) if encoder.sort_keys else None)
+    else:
+        parts = _iter_json_parts(value, lambda value: encoder.encode(value).encode("UTF-8"), operator.itemgetter(0) if encoder.sort_keys else None)
+    return _iter_chunks(itertools.chain(parts, (b"\n", )))
+
+
+def _is_small_msgpack(value):
+    return _is_small(value) and not (isinstance(value, dict) and not all(map(isinstance, value, itertools.repeat(str))))
+
+
+def _strip_msgpack_header(data):
+    # Fix maps and arrays have a 1 byte header whereas 16 and 32 bit maps (0xde and 0xdf) and arrays (0xdc and 0xdd) have 3 and 5 byte headers.
+    return data[1 if data[0] & 0xe0 == 0x80 else 3 if data[0] in (0xdc, 0xde) else 5:]
+
+
+def _iter_msgpack_parts(value, packer):
+    # As with JSON, large containers are generated incrementally with batches of small items packed as containers whose headers are then
+    # stripped. Keys are converted to strings to match JSON, which also keeps maps decodable by unpackers that only allow string keys.
+    if _is_small_msgpack(value):
+        yield packer.pack(value)
+        return
+    is_dict = isinstance(value, dict)
+    batch = []
+    yield packer.pack_map_header(len(value)) if is_dict else packer.pack_array_header(len(value))
+    for item in value.items() if is_dict else value:
+        if _is_small_msgpack(item[1] if is_dict else item):
+            batch.append((item[0] if isinstance(item[0], str) else str(item[0]), item[1]) if is_dict else item)
+            if len(batch) == _MAX_PART_LENGTH:
+                yield _strip_msgpack_header(packer.pack(dict(batch) if is_dict else batch))
+                batch = []
+            continue
+        if batch:
+            yield _strip_msgpack_header(packer.pack(dict(batch) if is_dict else batch))
+            batch = []
+        if is_dict:
+            yield packer.pack(item[0] if isinstance(item[0], str) else str(item[0]))
+        yield from _iter_msgpack_parts(item[1] if is_dict else item, packer)
+    if batch:
+        yield _strip_msgpack_header(packer.pack(dict(batch) if is_dict else batch))
+
+
+def iter_msgpack(value):
+    return _iter_chunks(_iter_msgpack_parts(value, msgpack.Packer(default=str)))
+
+
+def get_mimetype():
+    # MessagePack is only offered if it is installed and JSON is preferred if the client accepts both equally.
+    mimetypes = (JSON_MIMETYPE, ) + (MSGPACK_MIMETYPES if msgpack is not None else ())
+    return flask.request.accept_mimetypes.best_match(mimetypes, default=JSON_MIMETYPE)
+
+
+def iter_response(value, mimetype):
+    if mimetype in MSGPACK_MIMETYPES:
+        return iter_msgpack(value)
+    return iter_json(value)
+
+
+def load_request(request):
+    # Decodes the whole request body, which is MessagePack if the content type says so and JSON otherwise.
+    if request.mimetype in MSGPACK_MIMETYPES:
+        if msgpack is None:
+            flask.abort(415, "MessagePack is not supported.")
+        try:
+            return msgpack.unpackb(request.get_data(), raw=False)
+        except (msgpack.UnpackException, ValueError):
+            flask.abort(400, "Invalid MessagePack.")
+    if orjson is None:
+        return request.get_json(force=True)
+    try:
+        return orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        flask.abort(400, "Invalid JSON.")
+
+
+def _iter_msgpack_array(stream):
+    unpacker = msgpack.Unpacker(stream, raw=False)
+    try:
+        for _ in range(unpacker.read_array_header()):
+            yield unpacker.unpack()
+    except (msgpack.UnpackException, msgpack.OutOfData, ValueError):
+        raise ValueError("Invalid MessagePack array.")
+
+
+def iter_msgpack_array(stream):
+    # Decodes the items of a top level MessagePack array one at a time so that arbitrarily large request bodies can be consumed in constant
+    # memory. Support is checked up front as the items are only decoded once the response has started streaming.
+    if msgpack is None:
+        flask.abort(415, "MessagePack is not supported.")
+    return _iter_msgpack_array(stream)
@@ -0,0 +1,99 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug import serving
+
+import convention
+import convention.launch  # noqa: F401
+from convention import migrations, models, sync
+
+
+_BACKLOG = 128
+_RESPAWN_DELAY = 1
+
+_workers = {}
+
+
+def _serve(sock, host, worker_number):
+    # The master's signal handlers are not wanted in the worker, which is simply terminated.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Only one worker synchronises sources, otherwise every source would be fetched once per worker.
+    if convention.app.config["SYNC_ENABLED"] and worker_number == 0:
+        sync.start()
+    # The host only determines the address family as the socket is inherited.
+    serving.make_server(host, 0, convention.app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def _spawn(sock, host, worker_number):
+    pid = os.fork()
+    if not pid:
+        # The worker must never return into the master's loop.
+        try:
+            _serve(sock, host, worker_number)
+        except BaseException:
+            convention.app.logger.exception("Worker %d failed.", os.getpid())
+        finally:
+            os._exit(1)
+    _workers[pid] = worker_number
+
+
+def _stop(signal_number, frame):
+    for pid in _workers:
+        os.kill(pid, signal.SIGTERM)
+    sys.exit(0)
+
+
+def serve(host, port, worker_count, upgrade=True):
+    # Serves from a pool of forked worker processes that share a listening socket, so that requests are handled across every core rather
+    # than by a single GIL bound process. The database is upgraded and the caches are warmed once in the master before forking so that the
+    # workers inherit them, and the garbage collector is told to leave the inherited objects alone so that their memory stays shared rather
+    # than being copied into each worker as their reference counts are touched. Workers that die are replaced.
+    if upgrade:
+        migrations.upgrade()
+    with convention.app.app_context():
+        models.preload()
+    # Connections must not be shared with the workers.
+    models.db.engine.dispose()
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(_BACKLOG)
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    for worker_number in range(worker_count):
+        _spawn(sock, host, worker_number)
+    convention.app.logger.info("Serving on %s:%s with %d workers.", host, port, worker_count)
+    while True:
+        pid, status = os.wait()
+        worker_number = _workers.pop(pid, None)
+        if worker_number is not None:
+            convention.app.logger.warning("Worker %d exited with status %d and is being replaced.", pid, status)
+            # Workers that fail on start would otherwise be replaced as fast as they can be forked.
+            time.sleep(_RESPAWN_DELAY)
+            _spawn(sock, host, worker_number)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the application from a pool of pre-forked worker processes.")
+    parser.add_argument("--host", default="127.0.0.1", help="The address to listen on.")
+    parser.add_argument("--port", type=int, default=5000, help="The port to listen on.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="The number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--no-upgrade", dest="upgrade", action="store_false", help="Do not create or upgrade the database before serving.")
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        parser.error("Pre-forked serving is not supported on this platform. Run launch.py instead.")
+    if convention.secret_key_generated:
+        parser.error("CONVENTION_SECRET_KEY must be set (or SECRET_KEY configured) so that tokens verify in every worker and on every host.")
+    serve(args.host, args.port, args.workers, args.upgrade)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import array
+import base64
+import json
+import sys
+import zlib
+
+# Plugins ship this module alongside validation.py, outside of the package, as importing the package needs Flask and the app's configuration.
+if __package__:
+    from . import validation
+else:
+    import validation
+
+
+FORMAT = 2
+# Format 1 did not hold the combination IDs, which are then numbered from 1 in the order that the combinations were packed.
+_FORMATS = (1, FORMAT)
+
+_TYPECODES = ("B", "H", "I", "L", "Q")
+
+
+def _get_typecode(max_value):
+    return next(typecode for typecode in _TYPECODES if max_value < 1 << 8 * array.array(typecode).itemsize)
+
+
+def _to_bytes(packed):
+    # Packed arrays are always little-endian.
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _from_bytes(typecode, data):
+    packed = array.array(typecode)
+    packed.frombytes(data)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed
+
+
+def _pack(group_count, restrictions):
+    # Values are dictionary encoded per group and combinations are packed as rows of 1-based indexes into those dictionaries (0 means no value),
+    # ordered by combination ID. The combination IDs are packed into a parallel array so that they are kept when the restrictions are rewritten.
+    values = [set() for _ in range(group_count)]
+    combinations = {}
+    for group_number, value, combination_ID in restrictions:
+        values[group_number - 1].add(value)
+        if combination_ID is not None:
+            combinations.setdefault(combination_ID, [None] * group_count)[group_number - 1] = value
+    dictionaries = [sorted(group_values) for group_values in values]
+    indexes = [{value: index for index, value in enumerate(dictionary, 1)} for dictionary in dictionaries]
+    packed = array.array(_get_typecode(max([len(dictionary) for dictionary in dictionaries] or [0])))
+    combination_IDs = array.array(_get_typecode(max(combinations or [0])), sorted(combinations))
+    for combination_ID in combination_IDs:
+        packed.extend(0 if value is None else index[value] for value, index in zip(combinations[combination_ID], indexes))
+    return dictionaries, packed.typecode, _to_bytes(packed), combination_IDs.typecode, _to_bytes(combination_IDs)
+
+
+def _unpack(dictionaries, typecode, data, ID_typecode=None, ID_data=None):
+    # Yields the (group number, value, combination ID) restrictions. As restrictions cannot mix values and combinations, the values are only
+    # yielded by themselves if there are no combinations.
+    packed = _from_bytes(typecode, data)
+    if not packed:
+        for group_number, dictionary in enumerate(dictionaries, 1):
+            for value in dictionary:
+                yield group_number, value, None
+        return
+    group_count = len(dictionaries)
+    combination_IDs = range(1, len(packed) // group_count + 1) if ID_typecode is None else _from_bytes(ID_typecode, ID_data)
+    for combination_index, combination_ID in enumerate(combination_IDs):
+        row = packed[combination_index * group_count:(combination_index + 1) * group_count]
+        for group_number, (index, dictionary) in enumerate(zip(row, dictionaries), 1):
+            if index:
+                yield group_number, dictionary[index - 1], combination_ID
+
+
+def _to_snapshot(pattern, is_regex, combinations_restricted, dictionaries, typecode, data, ID_typecode, ID_data, version, key):
+    return {
+        "format": FORMAT,
+        "key": key,
+        "version": version,
+        "pattern": pattern,
+        "is_regex": is_regex,
+        "combinations_restricted": combinations_restricted,
+        "values": dictionaries,
+        "combinations": {
+            "typecode": typecode,
+            "data": base64.b64encode(data).decode("ASCII"),
+            "ID_typecode": ID_typecode,
+            "IDs": base64.b64encode(ID_data).decode("ASCII")
+        }
+    }
+
+
+def encode(pattern, is_regex, combinations_restricted, restrictions, version=None, key=None):
+    # A snapshot is a compact, JSON serialisable encoding of everything required to validate against a convention.
+    return _to_snapshot(pattern, is_regex, combinations_restricted, *_pack(validation.compile_pattern(pattern, is_regex).groups, restrictions),
+                        version, key)
+
+
+def iter_restrictions(snapshot):
+    combinations = snapshot["combinations"]
+    return _unpack(snapshot["values"], combinations["typecode"], base64.b64decode(combinations["data"]), combinations.get("ID_typecode"),
+                   base64.b64decode(combinations.get("IDs", "")))
+
+
+def dumps(group_names, restrictions):
+    # Packs restrictions into a compressed blob for storage. The blob is a JSON header holding the dictionaries followed by a newline (which
+    # cannot appear in the header), the packed combination IDs and the packed combinations. The group names are kept so that a blob can be
+    # checked against a new pattern.
+    dictionaries, typecode, data, ID_typecode, ID_data = _pack(len(group_names), restrictions)
+    header = json.dumps({"format": FORMAT, "groups": group_names, "values": dictionaries, "typecode": typecode, "ID_typecode": ID_typecode,
+                         "ID_length": len(ID_data)}, separators=(",", ":"))
+    return zlib.compress(header.encode("UTF-8") + b"\n" + ID_data + data)
+
+
+def loads(blob):
+    # Returns the header, packed combinations and packed combination IDs of a blob.
+    header, _, data = zlib.decompress(blob).partition(b"\n")
+    header = json.loads(header.decode("UTF-8"))
+    if header["format"] not in _FORMATS:
+        raise ValueError("Unsupported blob format: %s." % header["format"])
+    ID_length = header.get("ID_length", 0)
+    return header, data[ID_length:], data[:ID_length]
+
+
+def iter_blob_restrictions(blob):
+    header, data, ID_data = loads(blob)
+    return _unpack(header["values"], header["typecode"], data, header.get("ID_typecode"), ID_data)
+
+
+def encode_blob(pattern, is_regex, combinations_restricted, blob, version=None, key=None):
+    # The blob already holds the packed combinations so a snapshot can be built from it without unpacking them. The combination IDs of a
+    # format 1 blob are left out of the snapshot too, so that they are numbered in the same way when read back.
+    header, data, ID_data = loads(blob)
+    return _to_snapshot(pattern, is_regex, combinations_restricted, header["values"], header["typecode"], data, header.get("ID_typecode"),
+                        ID_data, version, key)
+
+
+def decode(snapshot):
+    if snapshot.get("format") not in _FORMATS:
+        raise ValueError("Unsupported snapshot format: %s." % snapshot.get("format"))
+    return validation.CompiledConvention(snapshot["pattern"], snapshot["is_regex"], snapshot["combinations_restricted"],
+                                         iter_restrictions(snapshot), snapshot["version"])
@@ -0,0 +1,145 @@
+import collections
+from concurrent import futures
+import csv
+import datetime
+import threading
+
+import requests
+import sqlalchemy
+
+import convention
+from convention import models
+
+
+_MAX_WORKERS = convention.app.config["SYNC_MAX_WORKERS"]
+_POLL_INTERVAL = convention.app.config["SYNC_POLL_INTERVAL"]
+_TIMEOUT = convention.app.config["SYNC_TIMEOUT"]
+
+_scheduler = None
+
+
+class SourceAdapter(object):
+    def __init__(self, location, argument=None):
+        self.location = location
+        self.argument = argument
+
+    def fetch(self):
+        raise NotImplementedError
+
+
+class CSVSource(SourceAdapter):
+    # The argument is the header of the column that contains the values.
+    def fetch(self):
+        with open(self.location, newline="", encoding="UTF-8") as f:
+            return [row[self.argument] for row in csv.DictReader(f)]
+
+
+class JSONSource(SourceAdapter):
+    # The argument is an optional dot separated path to the list of values within the document, e.g. "data.campaign_objectives".
+    def fetch(self):
+        response = requests.get(self.location, timeout=_TIMEOUT)
+        response.raise_for_status()
+        values = response.json()
+        for key in self.argument.split(".") if self.argument else ():
+            values = values[key]
+        return values
+
+
+class SQLSource(SourceAdapter):
+    # The location is a database URI and the argument is a query whose first column contains the values.
+    def fetch(self):
+        engine = sqlalchemy.create_engine(self.location)
+        try:
+            return [row[0] for row in engine.execute(sqlalchemy.text(self.argument))]
+        finally:
+            engine.dispose()
+
+
+ADAPTERS = {
+    "csv": CSVSource,
+    "json": JSONSource,
+    "sql": SQLSource
+}
+
+
+class _Scheduler(threading.Thread):
+    def __init__(self, adapters):
+        super(_Scheduler, self).__init__(name="convention-sync", daemon=True)
+        self.adapters = adapters
+        self._wake = threading.Event()
+
+    def run(self):
+        while True:
+            with convention.app.app_context():
+                try:
+                    synchronise(models.Source.get_due(), self.adapters)
+                except Exception:
+                    convention.app.logger.exception("Failed to synchronise sources.")
+            self._wake.wait(_POLL_INTERVAL)
+            self._wake.clear()
+
+    def trigger(self):
+        self._wake.set()
+
+
+def _apply(c, fetched):
+    # Only the difference between the fetched and current values is applied so a convention whose values have not changed is not written to.
+    compiled = c.compiled
+    if compiled.combination_IDs:
+        convention.app.logger.warning("Convention %s restricts combinations so its sources cannot be synchronised.", c.key)
+        return
+    add_values = [[] for _ in compiled.values]
+    remove_values = [[] for _ in compiled.values]
+    for group_number, values in fetched.items():
+        if not 1 <= group_number <= len(compiled.values):
+            convention.app.logger.warning("Convention %s has no capturing group %s to synchronise.", c.key, group_number)
+            continue
+        current = compiled.values[group_number - 1] or frozenset()
+        add_values[group_number - 1] = list(values - current)
+        remove_values[group_number - 1] = list(current - values)
+    c.update_restrictions(add_values=add_values, remove_values=remove_values)
+
+
+def synchronise(sources, adapters=None):
+    # Fetching is I/O bound so all sources are fetched concurrently, whereas the results are applied in the calling thread as the session is
+    # not thread safe. A source that fails, or returns no values (which would otherwise lift the restriction entirely), is skipped.
+    adapters = ADAPTERS if adapters is None else adapters
+    if not sources:
+        return
+    fetched = collections.defaultdict(dict)
+    with futures.ThreadPoolExecutor(_MAX_WORKERS) as executor:
+        pending = {executor.submit(adapters[source.adapter](source.location, source.argument).fetch): source for source in sources}
+        for future in futures.as_completed(pending):
+            source = pending[future]
+            try:
+                values = {str(value) for value in future.result()}
+            except Exception:
+                convention.app.logger.exception("Failed to fetch values for source %s.", source.key)
+                continue
+            if not values:
+                convention.app.logger.warning("Source %s returned no values.", source.key)
+                continue
+            fetched[source.convention][source.group_number] = values
+            source.last_synced_utc = datetime.datetime.utcnow()
+    for c, groups in fetched.items():
+        try:
+            _apply(c, groups)
+        except models.ConventionException:
+            convention.app.logger.exception("Failed to synchronise convention %s.", c.key)
+    models.db.session.commit()
+
+
+def start(adapters=None):
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = _Scheduler(ADAPTERS if adapters is None else adapters)
+        _scheduler.start()
+
+
+def trigger(c):
+    # Syncing happens on the scheduler's thread so that request handling is never blocked on a source.
+    for source in c.sources:
+        source.last_synced_utc = None
+    models.db.session.commit()
+    if _scheduler is not None:
+        _scheduler.trigger()
@@ -17,4 +17,4 @@ def _before_request():
 
 @login_manager.user_loader
 def _load_user(user_key):
-    return models.User.query.get(int(user_key))
+    return models.User.load(int(user_key))
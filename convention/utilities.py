@@ -1,7 +1,67 @@
+import codecs
+import collections
+import json
+import threading
+import time
+
 import flask
 import flask_login
 import requests
 
+from convention import serialisers
+
+
+class LRUCache(object):
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires_at, value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+        return default if item is None else item[1]
+
+    def pop_where(self, predicate):
+        # Removes every item whose key satisfies the predicate, for caches keyed on tuples that cannot be popped by a prefix.
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                del self._items[key]
+
+    def set(self, key, value, ttl=None):
+        # An explicit ttl (in seconds) overrides the cache's default for this item only.
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._items[key] = (None if ttl is None else time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
 
 class OAuthProvider(object):
     _ACCESS_TOKEN_METHOD = "GET"
@@ -64,6 +124,59 @@ class GoogleOAuth(OAuthProvider):
     _USER_INFO_URL = "https://www.googleapis.com/userinfo/v2/me"
 
 
+def iter_json_array(stream, chunk_size=65536):
+    # Decodes the items of a top level JSON array one at a time so that arbitrarily large request bodies can be consumed in constant memory.
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("UTF-8")()
+    buffer = ""
+    position = 0
+    exhausted = False
+    started = False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ",")):
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array.")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                end = None
+            # A value that ends at the edge of the buffer may have been truncated (e.g. a number) so it is only accepted once more data is read.
+            if end is not None and (end < len(buffer) or exhausted):
+                yield item
+                position = end
+                continue
+        if exhausted:
+            raise ValueError("Invalid JSON array.")
+        chunk = stream.read(chunk_size)
+        exhausted = not chunk
+        buffer = buffer[position:] + text_decoder.decode(chunk, final=exhausted)
+        position = 0
+
+
+def iter_json_lines(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line.decode("UTF-8"))
+
+
+def iter_request_items(request):
+    # NDJSON bodies are consumed line by line whereas anything else is expected to be a single JSON or MessagePack array.
+    if request.mimetype in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines"):
+        return iter_json_lines(request.stream)
+    if request.mimetype in serialisers.MSGPACK_MIMETYPES:
+        return serialisers.iter_msgpack_array(request.stream)
+    return iter_json_array(request.stream)
+
+
 def redirect(endpoint=None):
     # http://flask.pocoo.org/snippets/63/ safe next checks
     # http://flask.pocoo.org/snippets/62/ safe next checks
@@ -0,0 +1,769 @@
+import bisect
+import fnmatch
+import functools
+import heapq
+import itertools
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+def compile_pattern(pattern, is_regex):
+    return re.compile(pattern if is_regex else fnmatch.translate(pattern))
+
+
+def _get_literal_prefix(parsed):
+    # Returns the literal characters that any match of the parsed pattern must start with and whether the pattern is entirely literal.
+    prefix = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            prefix.append(chr(av))
+        elif op is sre_parse.AT and av in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING) and not prefix:
+            continue
+        elif op is sre_parse.SUBPATTERN and not av[1] & sre_parse.SRE_FLAG_IGNORECASE:
+            group_prefix, complete = _get_literal_prefix(av[-1])
+            prefix.extend(group_prefix)
+            if not complete:
+                return prefix, False
+        else:
+            return prefix, False
+    return prefix, True
+
+
+def get_literal_prefix(regex):
+    if regex.flags & re.IGNORECASE:
+        return ""
+    return "".join(_get_literal_prefix(sre_parse.parse(regex.pattern, regex.flags))[0])
+
+
+_MAX_DFA_STATES = 10000
+_MAX_PROGRAM_SIZE = 10000
+_MAX_WILDCARD_REPEATS = 2
+# Values in fewer than one in this many combinations are indexed by their sorted positions, which take 8 bytes each, rather than a bitmap.
+_SPARSE_FRACTION = 64
+_WILDCARD_CATEGORIES = {sre_parse.CATEGORY_NOT_DIGIT, sre_parse.CATEGORY_NOT_SPACE, sre_parse.CATEGORY_NOT_WORD}
+
+# Each step takes a few microseconds, so the default gives up on a name after roughly a fifth of a second.
+DEFAULT_STEP_BUDGET = 50000
+# Longer names are never valid, which bounds the time taken to match any name, whichever engine is used.
+DEFAULT_MAX_NAME_LENGTH = 1000
+ENGINES = ("auto", "linear", "re")
+
+
+def _is_wildcard(parsed):
+    # Whether a repeated item can match (nearly) any character, such that consecutive repeats of it overlap.
+    if len(parsed) != 1:
+        return False
+    op, av = parsed[0]
+    if op is sre_parse.ANY or op is sre_parse.NOT_LITERAL:
+        return True
+    return op is sre_parse.IN and any(item_op is sre_parse.NEGATE or (item_op is sre_parse.CATEGORY and item_av in _WILDCARD_CATEGORIES)
+                                      for item_op, item_av in av)
+
+
+def _get_alphabet(parsed):
+    # The characters that first characters are worked out over: Latin-1 and any other character that the pattern refers to.
+    alphabet = {chr(c) for c in range(256)}
+    for op, av in parsed:
+        if op is sre_parse.LITERAL or op is sre_parse.NOT_LITERAL:
+            alphabet.add(chr(av))
+        elif op is sre_parse.RANGE:
+            alphabet.update((chr(av[0]), chr(av[1])))
+        elif op is sre_parse.IN:
+            alphabet |= _get_alphabet(av)
+        elif op is sre_parse.SUBPATTERN:
+            alphabet |= _get_alphabet(av[-1])
+        elif op is sre_parse.BRANCH:
+            for branch in av[1]:
+                alphabet |= _get_alphabet(branch)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            alphabet |= _get_alphabet(av[-1])
+    return alphabet
+
+
+def _get_first_characters(parsed, flags, alphabet):
+    # Returns the characters (of the alphabet) that a match of the parsed pattern can start with and whether it can match an empty string.
+    # Anything that cannot be worked out is assumed to start with any character.
+    first = set()
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            first.update(_get_cases(chr(av), flags))
+        elif op is sre_parse.NOT_LITERAL:
+            cases = set(_get_cases(chr(av), flags))
+            first.update(c for c in alphabet if cases.isdisjoint(_get_cases(c, flags)))
+        elif op is sre_parse.IN:
+            try:
+                predicate = _get_set_predicate(av, flags)
+            except UnsupportedPattern:
+                predicate = None
+            first.update(c for c in alphabet if predicate is None or predicate(c))
+        elif op is sre_parse.SUBPATTERN:
+            characters, nullable = _get_first_characters(av[-1], (flags | av[1]) & ~av[2], alphabet)
+            first |= characters
+            if not nullable:
+                return first, False
+            continue
+        elif op is sre_parse.BRANCH:
+            nullable = False
+            for branch in av[1]:
+                characters, branch_nullable = _get_first_characters(branch, flags, alphabet)
+                first |= characters
+                nullable = nullable or branch_nullable
+            if not nullable:
+                return first, False
+            continue
+        elif op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT:
+            characters, nullable = _get_first_characters(av[2], flags, alphabet)
+            first |= characters
+            if av[0] and not nullable:
+                return first, False
+            continue
+        elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        else:
+            first |= alphabet
+            if op is not sre_parse.ANY:
+                continue
+        return first, False
+    return first, True
+
+
+def _find_superlinear_constructs(parsed, flags, alphabet, in_unbounded_repeat, constructs):
+    # Returns the number of wildcard repeats found whilst appending descriptions of any nested unbounded repeats, or overlapping alternatives
+    # within an unbounded repeat, to constructs.
+    wildcard_repeats = 0
+    for op, av in parsed:
+        if op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT:
+            unbounded = av[1] == sre_parse.MAXREPEAT
+            if unbounded and in_unbounded_repeat:
+                constructs.append("an unbounded repeat is nested within another")
+            wildcard_repeats += unbounded and _is_wildcard(av[2])
+            wildcard_repeats += _find_superlinear_constructs(av[2], flags, alphabet, in_unbounded_repeat or unbounded, constructs)
+        elif op is sre_parse.SUBPATTERN:
+            wildcard_repeats += _find_superlinear_constructs(av[-1], (flags | av[1]) & ~av[2], alphabet, in_unbounded_repeat, constructs)
+        elif op is sre_parse.BRANCH:
+            if in_unbounded_repeat:
+                # Alternatives that can match the same text, e.g. (a|a) or (a|ab), or that can both match an empty string, e.g. a(|), give
+                # backtracking a choice at every repetition.
+                branches = [_get_first_characters(branch, flags, alphabet) for branch in av[1]]
+                if (sum(nullable for _, nullable in branches) > 1 or
+                        any(first & other_first for index, (first, _) in enumerate(branches) for other_first, _ in branches[index + 1:])):
+                    constructs.append("overlapping alternatives are repeated without bound")
+            wildcard_repeats += max(_find_superlinear_constructs(branch, flags, alphabet, in_unbounded_repeat, constructs) for branch in av[1])
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            wildcard_repeats += _find_superlinear_constructs(av[1], flags, alphabet, in_unbounded_repeat, constructs)
+    return wildcard_repeats
+
+
+def _count_overlapping_repeats(parsed, flags, alphabet, run):
+    # Returns the most unbounded repeats found in a row that can all match the same character, with nothing between them that they cannot
+    # match, as backtracking tries every way of dividing a run of that character between them. The run is a [count, characters] list.
+    most = 0
+    for op, av in parsed:
+        if op is sre_parse.SUBPATTERN:
+            most = max(most, _count_overlapping_repeats(av[-1], (flags | av[1]) & ~av[2], alphabet, run))
+            continue
+        if (op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT) and av[1] == sre_parse.MAXREPEAT:
+            characters = _get_first_characters(av[2], flags, alphabet)[0]
+            common = run[1] & characters if run[0] else characters
+            run[:] = [run[0] + 1, common] if common else [1, characters]
+            most = max(most, run[0])
+            continue
+        characters, nullable = _get_first_characters([(op, av)], flags, alphabet)
+        if not nullable:
+            run[1] = run[1] & characters
+            if not run[1]:
+                run[:] = [0, set()]
+    return most
+
+
+@functools.lru_cache(maxsize=1024)
+def get_superlinear_constructs(regex):
+    # Returns descriptions of any constructs that can make backtracking take exponential time, i.e. an unbounded repeat within another such as
+    # (a+)+ or overlapping alternatives within one such as (a|ab)+, or polynomial time of a high degree, i.e. several unbounded repeats of
+    # wildcards such as .*_.*_.* (as wildcard patterns become). This is a heuristic that patterns are checked against before they are accepted.
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    constructs = []
+    alphabet = _get_alphabet(parsed)
+    wildcard_repeats = _find_superlinear_constructs(parsed, regex.flags, alphabet, False, constructs)
+    if wildcard_repeats > _MAX_WILDCARD_REPEATS:
+        constructs.append("%d unbounded repeats of wildcards" % wildcard_repeats)
+    overlapping_repeats = _count_overlapping_repeats(parsed, regex.flags, alphabet, [0, set()])
+    if overlapping_repeats > _MAX_WILDCARD_REPEATS:
+        constructs.append("%d unbounded repeats in a row that can match the same characters" % overlapping_repeats)
+    # The result is cached, as patterns are analysed whenever they are compiled, so it must not be modified.
+    return tuple(sorted(set(constructs)))
+
+
+class UnsupportedPattern(ValueError):
+    pass
+
+
+class StepBudgetExceeded(RuntimeError):
+    pass
+
+
+_CHAR, _SPLIT, _JUMP, _SAVE, _ASSERT, _MATCH = range(6)
+
+
+def _is_digit(c, flags):
+    return "0" <= c <= "9" if flags & sre_parse.SRE_FLAG_ASCII else c.isdecimal()
+
+
+def _is_space(c, flags):
+    return c in " \t\n\r\f\v" if flags & sre_parse.SRE_FLAG_ASCII else c.isspace()
+
+
+def _is_word(c, flags):
+    return c == "_" or (c.isalnum() and (c.isascii() or not flags & sre_parse.SRE_FLAG_ASCII))
+
+
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: _is_digit,
+    sre_parse.CATEGORY_NOT_DIGIT: lambda c, flags: not _is_digit(c, flags),
+    sre_parse.CATEGORY_SPACE: _is_space,
+    sre_parse.CATEGORY_NOT_SPACE: lambda c, flags: not _is_space(c, flags),
+    sre_parse.CATEGORY_WORD: _is_word,
+    sre_parse.CATEGORY_NOT_WORD: lambda c, flags: not _is_word(c, flags)
+}
+
+
+def _get_cases(c, flags):
+    return (c, c.lower(), c.upper()) if flags & sre_parse.SRE_FLAG_IGNORECASE else (c, )
+
+
+def _get_set_predicate(items, flags):
+    negate = False
+    characters = set()
+    ranges = []
+    categories = []
+    for op, av in items:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL:
+            characters.add(chr(av))
+        elif op is sre_parse.RANGE:
+            ranges.append((chr(av[0]), chr(av[1])))
+        elif op is sre_parse.CATEGORY and av in _CATEGORIES:
+            categories.append(_CATEGORIES[av])
+        else:
+            raise UnsupportedPattern("Unsupported character set item: %s." % op)
+
+    def predicate(c):
+        matched = any(case in characters or any(low <= case <= high for low, high in ranges) or any(category(case, flags)
+                                                                                                    for category in categories)
+                      for case in _get_cases(c, flags))
+        return matched is not negate
+    return predicate
+
+
+def _get_assertion(at, flags):
+    multiline = flags & sre_parse.SRE_FLAG_MULTILINE
+
+    def is_boundary(s, position):
+        return (position > 0 and _is_word(s[position - 1], flags)) != (position < len(s) and _is_word(s[position], flags))
+
+    if at is sre_parse.AT_BEGINNING:
+        return (lambda s, position: position == 0 or s[position - 1] == "\n") if multiline else (lambda s, position: position == 0)
+    if at is sre_parse.AT_BEGINNING_STRING:
+        return lambda s, position: position == 0
+    if at is sre_parse.AT_END:
+        if multiline:
+            return lambda s, position: position == len(s) or s[position] == "\n"
+        return lambda s, position: position == len(s) or (position == len(s) - 1 and s[position] == "\n")
+    if at is sre_parse.AT_END_STRING:
+        return lambda s, position: position == len(s)
+    if at is sre_parse.AT_BOUNDARY:
+        return is_boundary
+    if at is sre_parse.AT_NON_BOUNDARY:
+        return lambda s, position: not is_boundary(s, position)
+    raise UnsupportedPattern("Unsupported assertion: %s." % at)
+
+
+class LinearMatcher(object):
+    # Matches a regex in time linear in the length of the string by simulating every possible path through the pattern at once (a Pike VM)
+    # rather than backtracking. Threads are kept in priority order so that the groups captured are the same as re's. Backreferences and
+    # lookaround assertions cannot be matched this way and the number of steps taken is bounded by step_budget.
+    def __init__(self, regex, step_budget=DEFAULT_STEP_BUDGET):
+        if regex.flags & sre_parse.SRE_FLAG_LOCALE:
+            raise UnsupportedPattern("Locale dependent patterns are not supported.")
+        self.regex = regex
+        self.step_budget = step_budget
+        self._program = []
+        self._compile(sre_parse.parse(regex.pattern, regex.flags), regex.flags)
+        self._emit(_MATCH)
+
+    def __getstate__(self):
+        # The program holds closures, which cannot be pickled, so it is rebuilt instead.
+        return self.regex, self.step_budget
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @staticmethod
+    def supports(regex):
+        try:
+            LinearMatcher(regex)
+        except UnsupportedPattern:
+            return False
+        return True
+
+    def _emit(self, op, a=None, b=None):
+        if len(self._program) >= _MAX_PROGRAM_SIZE:
+            raise UnsupportedPattern("The pattern is too large.")
+        self._program.append([op, a, b])
+        return len(self._program) - 1
+
+    def _compile(self, parsed, flags):
+        for op, av in parsed:
+            if op is sre_parse.LITERAL:
+                cases = set(_get_cases(chr(av), flags))
+                self._emit(_CHAR, cases.__contains__ if flags & sre_parse.SRE_FLAG_IGNORECASE else chr(av).__eq__)
+            elif op is sre_parse.NOT_LITERAL:
+                cases = set(_get_cases(chr(av), flags))
+                self._emit(_CHAR, lambda c, cases=cases, flags=flags: cases.isdisjoint(_get_cases(c, flags)))
+            elif op is sre_parse.ANY:
+                self._emit(_CHAR, (lambda c: True) if flags & sre_parse.SRE_FLAG_DOTALL else "\n".__ne__)
+            elif op is sre_parse.IN:
+                self._emit(_CHAR, _get_set_predicate(av, flags))
+            elif op is sre_parse.AT:
+                self._emit(_ASSERT, _get_assertion(av, flags), (av, bool(flags & sre_parse.SRE_FLAG_MULTILINE)))
+            elif op is sre_parse.SUBPATTERN:
+                group, add_flags, delete_flags, subpattern = av
+                if group is not None:
+                    self._emit(_SAVE, 2 * (group - 1))
+                self._compile(subpattern, (flags | add_flags) & ~delete_flags)
+                if group is not None:
+                    self._emit(_SAVE, 2 * (group - 1) + 1)
+            elif op is sre_parse.BRANCH:
+                jumps = []
+                for branch in av[1][:-1]:
+                    split = self._emit(_SPLIT, len(self._program) + 1)
+                    self._compile(branch, flags)
+                    jumps.append(self._emit(_JUMP))
+                    self._program[split][2] = len(self._program)
+                self._compile(av[1][-1], flags)
+                for jump in jumps:
+                    self._program[jump][1] = len(self._program)
+            elif op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT:
+                self._compile_repeat(av, flags, op is sre_parse.MAX_REPEAT)
+            else:
+                raise UnsupportedPattern("Unsupported construct: %s." % op)
+
+    def _compile_repeat(self, av, flags, greedy):
+        # Each split prefers to enter the repeated item if greedy and to skip it otherwise.
+        minimum, maximum, subpattern = av
+        if maximum == sre_parse.MAXREPEAT and not subpattern.getwidth()[0]:
+            # re allows an empty iteration of such a repeat, which a thread cannot do without looping, so groups would be captured differently.
+            raise UnsupportedPattern("Unbounded repeats of patterns that can match an empty string are not supported.")
+        for _ in range(minimum):
+            self._compile(subpattern, flags)
+        splits = []
+        if maximum == sre_parse.MAXREPEAT:
+            split = self._emit(_SPLIT)
+            self._compile(subpattern, flags)
+            self._emit(_JUMP, split)
+            splits.append(split)
+        else:
+            for _ in range(maximum - minimum):
+                splits.append(self._emit(_SPLIT))
+                self._compile(subpattern, flags)
+        for split in splits:
+            self._program[split][1:] = [split + 1, len(self._program)] if greedy else [len(self._program), split + 1]
+
+    def _add_thread(self, threads, seen, pc, captures, s, position):
+        # Follows every path from pc that does not consume a character, in priority order, adding the threads that do (or that match).
+        program = self._program
+        stack = [(pc, captures)]
+        while stack:
+            pc, captures = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+            op, a, b = program[pc]
+            if op == _JUMP:
+                stack.append((a, captures))
+            elif op == _SPLIT:
+                stack.append((b, captures))
+                stack.append((a, captures))
+            elif op == _SAVE:
+                stack.append((pc + 1, captures[:a] + (position, ) + captures[a + 1:]))
+            elif op == _ASSERT:
+                if a(s, position):
+                    stack.append((pc + 1, captures))
+            else:
+                threads.append((pc, captures))
+
+    def match(self, s):
+        # Returns the groups captured by matching from the start of s, as re's match does, or None if it does not match.
+        program = self._program
+        threads = []
+        self._add_thread(threads, set(), 0, (None, ) * (2 * self.regex.groups), s, 0)
+        matched = None
+        steps = 0
+        for position in range(len(s) + 1):
+            if not threads:
+                break
+            steps += len(threads)
+            if steps > self.step_budget:
+                raise StepBudgetExceeded("Matching exceeded the budget of %d steps." % self.step_budget)
+            c = s[position] if position < len(s) else None
+            next_threads = []
+            seen = set()
+            for pc, captures in threads:
+                op, predicate, _ = program[pc]
+                if op == _MATCH:
+                    # Any remaining threads are of a lower priority than this match so are discarded.
+                    matched = captures
+                    break
+                if c is not None and predicate(c):
+                    self._add_thread(next_threads, seen, pc + 1, captures, s, position + 1)
+            threads = next_threads
+        if matched is None:
+            return None
+        return tuple(None if matched[index] is None or matched[index + 1] is None else s[matched[index]:matched[index + 1]]
+                     for index in range(0, len(matched), 2))
+
+
+_AT_START, _AT_END, _AT_END_OR_FINAL_NEWLINE = range(3)
+
+
+def _get_anchor(program, pc):
+    # Returns what the assertion at pc anchors the match to, if the union matcher can check it: the start of the string, or the end of the
+    # string (or its final newline, as $ allows) provided that nothing but the match can follow.
+    at, multiline = program[pc][2]
+    if at is sre_parse.AT_BEGINNING_STRING or (at is sre_parse.AT_BEGINNING and not multiline):
+        return _AT_START
+    if at is sre_parse.AT_END_STRING or (at is sre_parse.AT_END and not multiline):
+        pc += 1
+        while program[pc][0] in (_SAVE, _JUMP):
+            pc = program[pc][1] if program[pc][0] == _JUMP else pc + 1
+        if program[pc][0] == _MATCH:
+            return _AT_END if at is sre_parse.AT_END_STRING else _AT_END_OR_FINAL_NEWLINE
+    return None
+
+
+class _DFAState(object):
+    __slots__ = ("characters", "matched", "matched_at_end", "matched_before_final_newline", "transitions")
+
+    def __init__(self, characters, matched, matched_at_end, matched_before_final_newline):
+        self.characters = characters
+        self.matched = matched
+        self.matched_at_end = matched_at_end
+        self.matched_before_final_newline = matched_before_final_newline
+        self.transitions = {}
+
+
+class UnionMatcher(object):
+    # Finds which of several linear matcher programs match from the start of a string in a single pass. Every program is simulated at once,
+    # without captures, as a DFA that is built lazily: each set of threads that the programs can be in is a state whose transition on a
+    # character is worked out on first use and then cached. Programs can only be anchored to the start or end of the string.
+    def __init__(self, programs):
+        self._programs = programs
+        self._anchors = [{pc: _get_anchor(program, pc) for pc, (op, _, _) in enumerate(program) if op == _ASSERT} for program in programs]
+        self._reset()
+
+    @staticmethod
+    def supports(program):
+        return all(op != _ASSERT or _get_anchor(program, pc) is not None for pc, (op, _, _) in enumerate(program))
+
+    def _reset(self):
+        self._states = {}
+        self._start = self._get_state([(index, 0) for index in range(len(self._programs))], True)
+
+    def _get_state(self, threads, at_start):
+        # Follows every path from the threads that does not consume a character. The threads that are left either consume a character, match
+        # or wait on the end of the string.
+        seen = set()
+        stack = list(threads)
+        while stack:
+            thread = stack.pop()
+            if thread in seen:
+                continue
+            seen.add(thread)
+            index, pc = thread
+            op, a, b = self._programs[index][pc]
+            if op == _JUMP:
+                stack.append((index, a))
+            elif op == _SPLIT:
+                stack.extend(((index, a), (index, b)))
+            elif op == _SAVE or (op == _ASSERT and at_start and self._anchors[index][pc] == _AT_START):
+                stack.append((index, pc + 1))
+        key = frozenset(thread for thread in seen if self._programs[thread[0]][thread[1]][0] in (_CHAR, _MATCH) or
+                        self._anchors[thread[0]].get(thread[1], _AT_START) != _AT_START)
+        state = self._states.get(key)
+        if state is None:
+            anchors = {index: self._anchors[index][pc] for index, pc in key if self._programs[index][pc][0] == _ASSERT}
+            state = self._states[key] = _DFAState(
+                tuple((index, pc, self._programs[index][pc][1]) for index, pc in key if self._programs[index][pc][0] == _CHAR),
+                frozenset(index for index, pc in key if self._programs[index][pc][0] == _MATCH), frozenset(anchors),
+                frozenset(index for index, anchor in anchors.items() if anchor == _AT_END_OR_FINAL_NEWLINE))
+        return state
+
+    def _step(self, state, c):
+        # The states are discarded and rebuilt as they are needed if there are too many of them.
+        if len(self._states) >= _MAX_DFA_STATES:
+            self._reset()
+        return self._get_state([(index, pc + 1) for index, pc, predicate in state.characters if predicate(c)], False)
+
+    def match(self, s):
+        # Returns the indexes of the programs that match.
+        state = self._start
+        matched = set(state.matched)
+        for position, c in enumerate(s):
+            if c == "\n" and position == len(s) - 1:
+                matched |= state.matched_before_final_newline
+            if not state.characters:
+                return matched
+            next_state = state.transitions.get(c)
+            if next_state is None:
+                next_state = state.transitions[c] = self._step(state, c)
+            state = next_state
+            matched |= state.matched
+        matched |= state.matched_at_end
+        return matched
+
+
+def _to_bitmap(positions, size):
+    # Setting bits in a bytearray and converting once is linear whereas or-ing bits into an int one at a time is quadratic.
+    bitmap = bytearray((size + 7) // 8)
+    for position in positions:
+        bitmap[position >> 3] |= 1 << (position & 7)
+    return bytes(bitmap)
+
+
+# Sets of combination positions are either sorted sequences (for values in few combinations) or bitmaps (bytes, for values in many), so
+# that the index takes space in proportion to the number of combinations rather than to the number of values times combinations.
+def _get_size(positions):
+    return len(positions) * 8 if isinstance(positions, bytes) else len(positions)
+
+
+def _contains(positions, position):
+    if isinstance(positions, bytes):
+        return positions[position >> 3] >> (position & 7) & 1
+    index = bisect.bisect_left(positions, position)
+    return index < len(positions) and positions[index] == position
+
+
+def _intersect(positions, other_positions):
+    if isinstance(positions, bytes) and isinstance(other_positions, bytes):
+        bitmap = int.from_bytes(positions, "little") & int.from_bytes(other_positions, "little")
+        # An empty intersection is returned as an empty tuple so that every empty set of positions is falsy.
+        return bitmap.to_bytes(len(positions), "little") if bitmap else ()
+    if isinstance(positions, bytes):
+        positions, other_positions = other_positions, positions
+    return tuple(position for position in positions if _contains(other_positions, position))
+
+
+def _overlaps(positions, other_positions):
+    if isinstance(positions, bytes) and isinstance(other_positions, bytes):
+        return int.from_bytes(positions, "little") & int.from_bytes(other_positions, "little") != 0
+    if isinstance(positions, bytes) or (not isinstance(other_positions, bytes) and len(other_positions) < len(positions)):
+        positions, other_positions = other_positions, positions
+    return any(_contains(other_positions, position) for position in positions)
+
+
+def _iter_positions(positions):
+    if not isinstance(positions, bytes):
+        yield from positions
+        return
+    for index, byte in enumerate(positions):
+        if byte:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield index * 8 + bit
+
+
+class CompiledConvention(object):
+    def __init__(self, pattern, is_regex, combinations_restricted, restrictions, version=None, engine="auto", step_budget=DEFAULT_STEP_BUDGET,
+                 max_name_length=DEFAULT_MAX_NAME_LENGTH):
+        self.pattern = pattern
+        self.is_regex = is_regex
+        self.combinations_restricted = combinations_restricted
+        self.version = version
+        self.max_name_length = max_name_length
+        self.regex = compile_pattern(pattern, is_regex)
+        # The auto engine only uses the (far slower) linear matcher for patterns that re could take super-linear time to match.
+        if engine not in ENGINES:
+            raise ValueError("The engine must be one of: %s." % ", ".join(ENGINES))
+        if engine == "linear" or (engine == "auto" and get_superlinear_constructs(self.regex) and LinearMatcher.supports(self.regex)):
+            self.matcher = LinearMatcher(self.regex, step_budget)
+        else:
+            self.matcher = None
+        values = [set() for _ in range(self.regex.groups)]
+        combinations = []
+        for group_number, value, combination_ID in restrictions:
+            values[group_number - 1].add(value)
+            if combination_ID is not None:
+                combinations.append((combination_ID, group_number, value))
+        # A group without any restrictions is unrestricted so we use None rather than an empty set to avoid rejecting every value.
+        self.values = tuple(frozenset(group_values) if group_values else None for group_values in values)
+        # Combinations are indexed by group and value, each mapping to the combinations (by position) that allow the value. A set of values
+        # is then a valid combination if the intersection of their positions is non-empty.
+        self.combination_IDs = sorted({combination_ID for combination_ID, _, _ in combinations})
+        positions = {combination_ID: position for position, combination_ID in enumerate(self.combination_IDs)}
+        index = [{} for _ in range(self.regex.groups)]
+        for combination_ID, group_number, value in combinations:
+            index[group_number - 1].setdefault(value, []).append(positions[combination_ID])
+        size = len(self.combination_IDs)
+        self.combination_index = tuple({value: (_to_bitmap(value_positions, size) if len(value_positions) * _SPARSE_FRACTION >= size
+                                                else tuple(sorted(value_positions)))
+                                        for value, value_positions in group_index.items()} for group_index in index)
+        self._sorted_values = {}
+        self._combination_values = {}
+
+    def get_combination_IDs(self, combination):
+        # Returns the IDs of any combinations that exactly match the given values, one per group.
+        matches = self.match_combinations(dict(enumerate(combination, 1))) if len(combination) == self.regex.groups else ()
+        return [self.combination_IDs[position] for position in _iter_positions(matches)]
+
+    def match_combinations(self, values):
+        # Returns the positions of combinations that allow every given value, where values maps group numbers to captured values. Groups
+        # that are not present are unconstrained. The intersection starts from the value in the fewest combinations.
+        candidates = sorted((self.combination_index[group_number - 1].get(value, ()) for group_number, value in values.items()), key=_get_size)
+        if not candidates:
+            return range(len(self.combination_IDs))
+        matches = candidates[0]
+        for positions in candidates[1:]:
+            if not matches:
+                break
+            matches = _intersect(matches, positions)
+        return matches
+
+    def _match(self, s):
+        if s is None or len(s) > self.max_name_length:
+            return None
+        if self.matcher is not None:
+            try:
+                groups = self.matcher.match(s)
+            except StepBudgetExceeded:
+                # A name that takes too long to match is treated as not matching rather than holding up the request.
+                return None
+            return None if groups is None else tuple(value or None for value in groups)
+        match = self.regex.match(s)
+        # Empty or non-participating groups are treated as null values which can never be allowable.
+        return None if match is None else tuple(value or None for value in match.groups())
+
+    def _validate_groups(self, groups):
+        if self.combinations_restricted:
+            return not groups or bool(self.match_combinations(dict(enumerate(groups, 1))))
+        return all(allowed is None or value in allowed for value, allowed in zip(groups, self.values))
+
+    def extract(self, names, chunk_size=10000):
+        # Yields the captured groups of the names in columnar chunks, along with a mask of which names were valid. Values are still captured
+        # for names that match the pattern but break the restrictions whereas names that don't match at all (or are None) capture nulls.
+        labels = self.group_labels
+        empty = (None, ) * len(labels)
+        names = iter(names)
+        while True:
+            chunk = list(itertools.islice(names, chunk_size))
+            if not chunk:
+                return
+            columns = [[] for _ in labels]
+            valid = []
+            for name in chunk:
+                groups = self._match(name)
+                valid.append(groups is not None and self._validate_groups(groups))
+                for column, value in zip(columns, groups or empty):
+                    column.append(value)
+            yield {"groups": dict(zip(labels, columns)), "valid": valid}
+
+    def get_group_number(self, label):
+        # Groups can be referred to by number or, if named, by name.
+        group_number = int(label) if label.isdigit() else self.regex.groupindex.get(label)
+        return group_number if group_number is not None and 1 <= group_number <= self.regex.groups else None
+
+    @property
+    def group_labels(self):
+        names = {number: name for name, number in self.regex.groupindex.items()}
+        return [names.get(number, str(number)) for number in range(1, self.regex.groups + 1)]
+
+    def suggest(self, group_number, prefix="", values=None, limit=10):
+        # Returns up to limit allowable values for the group that start with prefix, in alphabetical order. If combinations are restricted,
+        # values maps the numbers of any groups that have already been entered to their values and only values that can still form a valid
+        # combination are suggested. The sorted values act as a prefix index and, like the values of each combination, are built on first use.
+        sorted_values = self._sorted_values.get(group_number)
+        if sorted_values is None:
+            sorted_values = self._sorted_values[group_number] = sorted(self.values[group_number - 1] or ())
+        start = bisect.bisect_left(sorted_values, prefix)
+        # The last code point sorts after any other character that could follow the prefix.
+        end = bisect.bisect_right(sorted_values, prefix + "\U0010ffff", start) if prefix else len(sorted_values)
+        if not (self.combinations_restricted and values):
+            return sorted_values[start:min(end, start + limit)]
+        candidates = self.match_combinations(values)
+        if not candidates:
+            return []
+        # The values with the prefix are scanned in order until there are enough suggestions or as many values have been checked as it
+        # would take steps to read the values from the candidate combinations instead (one per position, or per byte of a bitmap).
+        group_index = self.combination_index[group_number - 1]
+        budget = len(candidates)
+        suggestions = []
+        for value in sorted_values[start:min(end, start + budget)]:
+            if _overlaps(candidates, group_index.get(value, ())):
+                suggestions.append(value)
+                if len(suggestions) == limit:
+                    return suggestions
+        if end - start <= budget:
+            return suggestions
+        combination_values = self._get_combination_values(group_number)
+        matching_values = {combination_values[position] for position in _iter_positions(candidates)}
+        return heapq.nsmallest(limit, (value for value in matching_values if value is not None and value.startswith(prefix)))
+
+    def _get_combination_values(self, group_number):
+        combination_values = self._combination_values.get(group_number)
+        if combination_values is None:
+            combination_values = self._combination_values[group_number] = [None] * len(self.combination_IDs)
+            for value, positions in self.combination_index[group_number - 1].items():
+                for position in _iter_positions(positions):
+                    combination_values[position] = value
+        return combination_values
+
+    def validate(self, s):
+        groups = self._match(s)
+        return groups is not None and self._validate_groups(groups)
+
+
+def _get_program(compiled):
+    if isinstance(compiled.matcher, LinearMatcher):
+        return compiled.matcher._program
+    try:
+        return LinearMatcher(compiled.regex)._program
+    except UnsupportedPattern:
+        return None
+
+
+class Classifier(object):
+    # Finds every convention that a name is valid against. Conventions that the union matcher supports are matched all at once, in a single
+    # pass over the name. The rest are bucketed by the literal prefix of their pattern so that only those whose prefix the name starts with (or
+    # that have no prefix) are tried. Only the conventions that match are then validated against their restrictions.
+    def __init__(self, compiled_conventions):
+        self._unprefixed = []
+        self._prefixed = {}
+        self._union_conventions = []
+        programs = []
+        for convention_key, compiled in compiled_conventions:
+            program = _get_program(compiled)
+            if program is not None and UnionMatcher.supports(program):
+                self._union_conventions.append((convention_key, compiled))
+                programs.append(program)
+                continue
+            prefix = get_literal_prefix(compiled.regex)
+            if prefix:
+                self._prefixed.setdefault(prefix, []).append((convention_key, compiled))
+            else:
+                self._unprefixed.append((convention_key, compiled))
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixed})
+        self._union = UnionMatcher(programs) if programs else None
+
+    def classify(self, s):
+        candidates = list(self._unprefixed)
+        for length in self._prefix_lengths:
+            if length > len(s):
+                break
+            candidates.extend(self._prefixed.get(s[:length], ()))
+        if self._union is not None:
+            candidates.extend(self._union_conventions[index] for index in self._union.match(s))
+        return sorted(convention_key for convention_key, compiled in candidates if compiled.validate(s))
@@ -1,8 +1,15 @@
 import flask
 
 import convention
+from convention import decorators, metrics
 
 
 @convention.app.route("/")
 def index():
     return flask.redirect(flask.url_for("auth.index"))
+
+
+@convention.app.route("/metrics")
+@decorators.add_cache_control()
+def get_metrics():
+    return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -6,6 +6,8 @@ setuptools.setup(
     author="Adam Cunnington",
     author_email="ac@adamcunnington.info",
     package_data={"": ("../convention.db", "*.env", "instance/*", "static/styles/*", "templates/*", "*/templates/*", "*/static/styles/*")},
+    # Earlier versions kept a generated signing key in the instance folder, which must never be packaged.
+    exclude_package_data={"": ("instance/secret_key", )},
     packages=setuptools.find_packages(),
     install_requires=[
         "flask",
@@ -17,5 +19,9 @@ setuptools.setup(
         "python-dotenv",
         "wrapt",
         "wtforms"
-    ]
+    ],
+    extras_require={
+        "msgpack": ["msgpack"],
+        "orjson": ["orjson"]
+    }
 )
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+os.environ.setdefault("CONVENTION_CONFIG", "test")
+
+import convention  # noqa: E402
+from convention import migrations, models  # noqa: E402
+
+
+_CACHES = (models._auth_tokens, models._users, models._compiled_conventions, models._convention_data, models._classifiers, models._snapshots,
+           models._validation_results, models._recent_writers)
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    yield
+    for cache in _CACHES:
+        cache.clear()
+
+
+@pytest.fixture
+def db():
+    # Each test gets a new in-memory database, as disposing of the engine closes the only connection to it.
+    with convention.app.app_context():
+        migrations.upgrade()
+        yield models.db
+        models.db.session.remove()
+        models.db.engine.dispose()
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(email="user@example.com", password="password")
+    db.session.add(user)
+    db.session.commit()
+    return user
@@ -0,0 +1,9 @@
+import argparse
+
+from benchmarks import explain
+
+
+def test_restriction_lookups_use_indexes(db):
+    statement_count, failures = explain.explain(argparse.Namespace(users=2, groups=3, values=10, combinations=100, seed=0))
+    assert statement_count
+    assert not failures
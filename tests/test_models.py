@@ -0,0 +1,83 @@
+import pytest
+
+from convention import models
+
+
+def _add_convention(db, user, storage, values=None, combinations=None):
+    c = models.Convention("convention", user, r"([a-z]+)_(\d+)", True, values=values, combinations=combinations, storage=storage)
+    db.session.add(c)
+    db.session.commit()
+    return c
+
+
+def _reload(db, c):
+    # Forgets everything compiled or loaded so that the restrictions are read back from the database.
+    key = c.key
+    models._compiled_conventions.clear()
+    db.session.expire_all()
+    return models.Convention.query.get(key)
+
+
+def _get_restriction_keys(c):
+    rows = models.Restriction.query.filter_by(convention_key=c.key).join(models.AllowableValue).join(models.AllowableGroup)
+    return {(group_number, value, combination_ID): key for key, group_number, value, combination_ID in rows.with_entities(
+        models.Restriction.key, models.AllowableGroup.number, models.AllowableValue.name, models.Restriction.combination_ID)}
+
+
+@pytest.mark.parametrize("storage", (models.ROW_STORAGE, models.ARRAY_STORAGE))
+def test_combination_IDs_are_kept(db, user, storage):
+    c = _add_convention(db, user, storage, combinations=[["aa", "1"], ["bb", "2"], ["cc", "3"]])
+    combination_IDs = {combination: c.compiled.get_combination_IDs(combination) for combination in (("aa", "1"), ("bb", "2"), ("cc", "3"))}
+    c.update_restrictions(remove_combinations=[["bb", "2"]], add_combinations=[["dd", "4"]])
+    db.session.commit()
+    c.update_restrictions(add_combinations=[["ee", "5"]])
+    db.session.commit()
+    c = _reload(db, c)
+    assert c.compiled.get_combination_IDs(("aa", "1")) == combination_IDs[("aa", "1")]
+    assert c.compiled.get_combination_IDs(("cc", "3")) == combination_IDs[("cc", "3")]
+    assert not c.compiled.get_combination_IDs(("bb", "2"))
+    added_IDs = c.compiled.get_combination_IDs(("dd", "4")) + c.compiled.get_combination_IDs(("ee", "5"))
+    assert len(set(added_IDs)) == 2 and not set(added_IDs) & {ID for IDs in combination_IDs.values() for ID in IDs}
+    assert c.validate("dd_4") and c.validate("ee_5") and not c.validate("bb_2") and not c.validate("aa_3")
+
+
+@pytest.mark.parametrize("storage", (models.ROW_STORAGE, models.ARRAY_STORAGE))
+def test_removed_restrictions_can_be_added_back(db, user, storage):
+    values = _add_convention(db, user, storage, values=[["aa", "bb"], ["1"]])
+    values.update_restrictions(add_values=[["aa"]], remove_values=[["aa", "bb"]])
+    combinations = _add_convention(db, user, storage, combinations=[["aa", "1"], ["bb", "2"]])
+    combinations.update_restrictions(add_combinations=[["aa", "1"]], remove_combinations=[["aa", "1"]])
+    db.session.commit()
+    values = _reload(db, values)
+    assert values.compiled.values == (frozenset(("aa", )), frozenset(("1", )))
+    combinations = _reload(db, combinations)
+    assert combinations.validate("aa_1") and combinations.validate("bb_2") and not combinations.validate("aa_2")
+
+
+def test_only_changed_rows_are_written(db, user):
+    values = _add_convention(db, user, models.ROW_STORAGE, values=[["aa", "bb", "cc"], ["1"]])
+    keys = _get_restriction_keys(values)
+    values.update_restrictions(add_values=[["dd"]], remove_values=[["bb"]])
+    combinations = _add_convention(db, user, models.ROW_STORAGE, combinations=[["aa", "1"], ["bb", "2"], ["cc", "3"]])
+    combination_keys = _get_restriction_keys(combinations)
+    combination_ID = combinations.compiled.get_combination_IDs(("bb", "2"))[0]
+    combinations.update_restrictions(add_combinations=[["dd", "4"]], remove_combinations=[["bb", "2"]])
+    db.session.commit()
+    updated_keys = _get_restriction_keys(values)
+    del keys[(1, "bb", None)]
+    assert {restriction: key for restriction, key in updated_keys.items() if restriction != (1, "dd", None)} == keys
+    assert (1, "dd", None) in updated_keys
+    updated_keys = _get_restriction_keys(combinations)
+    combination_keys = {restriction: key for restriction, key in combination_keys.items() if restriction[2] != combination_ID}
+    assert {restriction: key for restriction, key in updated_keys.items() if restriction in combination_keys} == combination_keys
+    assert len(updated_keys) == len(combination_keys) + 2
+
+
+def test_array_storage_does_not_write_rows(db, user):
+    c = _add_convention(db, user, models.ARRAY_STORAGE, values=[["aa", "bb"], ["1"]])
+    c.update_restrictions(add_values=[["cc"], ["2"]], remove_values=[["aa"]])
+    db.session.commit()
+    assert not _get_restriction_keys(c)
+    c = _reload(db, c)
+    assert c.compiled.values == (frozenset(("bb", "cc")), frozenset(("1", "2")))
+    assert c.validate("cc_2") and not c.validate("aa_1")
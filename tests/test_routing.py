@@ -0,0 +1,66 @@
+import base64
+import sqlite3
+
+import pytest
+
+import convention
+import convention.api.views  # noqa: F401
+import convention.users  # noqa: F401
+import convention.views  # noqa: F401
+from convention import migrations, models
+
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    # A primary and a replica in two SQLite files. The replica is a copy of the primary that never catches up, so a request that does not see
+    # the writes made after the copy read from the replica.
+    primary, replica = str(tmp_path / "primary.db"), str(tmp_path / "replica.db")
+    monkeypatch.setitem(convention.app.config, "SQLALCHEMY_DATABASE_URI", "sqlite:///" + primary)
+    monkeypatch.setitem(convention.app.config, "SQLALCHEMY_BINDS", {"replica": "sqlite:///" + replica})
+    monkeypatch.setattr(models, "_REPLICAS", ("replica", ))
+    # Requests only get their own app context, and so their own g and session, if there is no app context already.
+    with convention.app.app_context():
+        migrations.upgrade()
+        for email in ("writer@example.com", "reader@example.com"):
+            models.db.session.add(models.User(email=email, password="password"))
+        models.db.session.commit()
+    with sqlite3.connect(primary) as source, sqlite3.connect(replica) as destination:
+        source.backup(destination)
+    yield
+    with convention.app.app_context():
+        models.db.get_engine().dispose()
+        models.db.get_engine(bind="replica").dispose()
+
+
+def _get_headers(client, email):
+    credentials = base64.b64encode(("%s:password" % email).encode("UTF-8")).decode("ASCII")
+    token = client.post("/api/request-token", headers={"Authorization": "Basic " + credentials}).get_json()["token"]
+    return {"Authorization": "Basic " + base64.b64encode(token.encode("UTF-8")).decode("ASCII"), "Content-Type": "application/json"}
+
+
+def _get_convention_names(client, headers):
+    response = client.get("/api/conventions/?expand=1", headers=headers)
+    assert response.status_code == 200
+    return sorted(c["ConventionName"] for c in response.get_json()["items"])
+
+
+def test_reads_go_to_the_replica(databases):
+    client = convention.app.test_client()
+    headers = _get_headers(client, "reader@example.com")
+    with convention.app.app_context():
+        models.db.session.add(models.Convention("primary_only", models.User.query.filter_by(email="reader@example.com").one(), "*", False))
+        models.db.session.commit()
+    assert _get_convention_names(client, headers) == []
+
+
+def test_writers_read_their_own_writes(databases):
+    client = convention.app.test_client()
+    headers = _get_headers(client, "writer@example.com")
+    response = client.post("/api/conventions/", headers=headers, data='{"name": "written", "pattern": "*"}')
+    assert response.status_code == 201
+    # The cookie covers the writer's requests to any process whilst the process itself remembers the writer, even without the cookie.
+    assert _get_convention_names(client, headers) == ["written"]
+    client.cookie_jar.clear()
+    assert _get_convention_names(client, headers) == ["written"]
+    models._recent_writers.clear()
+    assert _get_convention_names(client, headers) == []
@@ -0,0 +1,23 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import convention
+from convention import snapshots
+
+
+def test_decode_without_package(tmp_path):
+    # Plugins validate against snapshots with only snapshots.py and validation.py, so neither may import Flask or the convention package.
+    for module in (snapshots.__file__, os.path.join(os.path.dirname(convention.__file__), "validation.py")):
+        shutil.copy(module, str(tmp_path))
+    snapshot = snapshots.encode(r"([a-z]+)_([0-9]+)", True, True, [(1, "ab", 3), (2, "1", 3), (1, "cd", 5), (2, "2", 5)], 1, 1)
+    script = ("import json, sys\n"
+              "sys.modules['flask'] = sys.modules['convention'] = None\n"
+              "import snapshots\n"
+              "compiled = snapshots.decode(json.loads(sys.stdin.read()))\n"
+              "print(compiled.validate('ab_1'), compiled.validate('ab_2'), sorted(compiled.combination_IDs))\n")
+    result = subprocess.run([sys.executable, "-c", script], cwd=str(tmp_path), input=json.dumps(snapshot), stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    assert result.stdout.split("\n")[0] == "True False [3, 5]"
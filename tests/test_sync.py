@@ -0,0 +1,36 @@
+from convention import models, sync
+
+
+class _StubSource(sync.SourceAdapter):
+    # The location is a comma separated list of the values.
+    def fetch(self):
+        return self.location.split(",")
+
+
+_ADAPTERS = {"stub": _StubSource}
+
+
+def _add_convention(db, user, values, location):
+    c = models.Convention("synchronised", user, r"([a-z]+)_([a-z]+)", True, values=values)
+    c.sources.append(models.Source(group_number=1, adapter="stub", location=location))
+    db.session.add(c)
+    db.session.commit()
+    return c
+
+
+def test_unchanged_values_are_not_written(db, user):
+    c = _add_convention(db, user, [["aa", "bb"], ["cc"]], "bb,aa")
+    version = c.version
+    sync.synchronise(models.Source.get_due(), _ADAPTERS)
+    assert c.version == version
+    assert c.compiled.values == (frozenset(("aa", "bb")), frozenset(("cc", )))
+    assert not models.Source.get_due()
+
+
+def test_differences_are_applied(db, user):
+    c = _add_convention(db, user, [["aa", "bb"], ["cc"]], "bb,dd")
+    version = c.version
+    sync.synchronise(models.Source.get_due(), _ADAPTERS)
+    assert c.version == version + 1
+    assert c.compiled.values == (frozenset(("bb", "dd")), frozenset(("cc", )))
+    assert c.validate("dd_cc") and not c.validate("aa_cc")
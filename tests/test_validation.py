@@ -0,0 +1,98 @@
+import itertools
+import random
+import re
+
+import pytest
+
+from convention import validation
+
+
+_PATTERNS = (
+    # Captures, including groups that are empty, do not participate or are repeated.
+    r"([a-z]+)_(\d+)", r"(a)|(b)", r"(a*)(b*)", r"(?:(a)|b)+", r"(a|ab)(c|bcd)?", r"((a)b)*", r"(?P<x>a+)(?P<y>b?)",
+    # Anchors.
+    r"^ab$", r"a$", r"a\Z", r"\Aa", r"(?m)a$", r"(?m)^b", r"a\b", r"a\Bb", r"(a$|ab)",
+    # Lazy and bounded repeats.
+    r"(a+?)(a*)", r"(a*?)b", r"(a??)(a)", r"(a{1,2}?)(a*)", r"a{2}(b{0,2})",
+    # Character sets and IGNORECASE.
+    r"(?i)(AB)", r"(?i)([^a]+)", r"(?i)[B-C]+", r"[^\d\s]+", r"\w+\W", r"(?s).b", r".b",
+)
+_ALPHABET = "abcA1 _\n"
+
+
+def _get_names():
+    return ["".join(characters) for length in range(5) for characters in itertools.product(_ALPHABET, repeat=length)]
+
+
+@pytest.mark.parametrize("pattern", _PATTERNS)
+def test_linear_matcher_matches_re(pattern):
+    regex = re.compile(pattern)
+    matcher = validation.LinearMatcher(regex)
+    for name in _get_names():
+        match = regex.match(name)
+        assert matcher.match(name) == (None if match is None else match.groups()), name
+
+
+def test_union_matcher_matches_re():
+    regexes = [re.compile(pattern) for pattern in _PATTERNS]
+    programs = [validation.LinearMatcher(regex)._program for regex in regexes]
+    supported = [index for index, program in enumerate(programs) if validation.UnionMatcher.supports(program)]
+    matcher = validation.UnionMatcher([programs[index] for index in supported])
+    for name in _get_names():
+        assert {supported[index] for index in matcher.match(name)} == {index for index in supported if regexes[index].match(name)}, name
+
+
+@pytest.mark.parametrize("pattern", [r"(a+)+$", r"(a|a)*b", r"(?=a)(a|a)*b", r"(a|ab|b)*c", r"(\w*)(\w*)(\w*)z", r".*_.*_.*"])
+def test_superlinear_patterns_are_flagged(pattern):
+    assert validation.get_superlinear_constructs(re.compile(pattern))
+
+
+@pytest.mark.parametrize("pattern", [r"([a-z]+)_(\d+)_([a-z]+)", r"^([A-Z]{2})_(\w+)$", r"(ab|a)*c", r"(\w|-)+", r"(foo|bar)+", r".*_.*"])
+def test_linear_patterns_are_not_flagged(pattern):
+    assert not validation.get_superlinear_constructs(re.compile(pattern))
+
+
+def test_matching_is_bounded():
+    compiled = validation.CompiledConvention(r"(\w*)(\w*)(\w*)(\w*)z", True, False, ())
+    assert isinstance(compiled.matcher, validation.LinearMatcher)
+    assert not compiled.validate("a" * 200000)
+    assert compiled.validate("a" * 100 + "z")
+    assert not validation.CompiledConvention(r"(\w*)(\w*)(\w*)(\w*)z", True, False, (), step_budget=100).validate("a" * 100 + "z")
+
+
+def test_combinations_match_sparse_and_dense_values():
+    # With 500 combinations, the values of the first group are in enough combinations to be indexed by bitmaps and the rest are not.
+    random_ = random.Random(0)
+    combinations = {combination_ID: (random_.choice("ab"), random_.choice("cdefghijklmnopqrstuvwxyz"), str(combination_ID))
+                    for combination_ID in random_.sample(range(1, 2000), 500)}
+    restrictions = [(group_number, value, combination_ID) for combination_ID, combination in combinations.items()
+                    for group_number, value in enumerate(combination, 1)]
+    compiled = validation.CompiledConvention(r"(\w)_(\w)_(\d+)", True, True, restrictions)
+    assert isinstance(compiled.combination_index[0]["a"], bytes)
+    assert all(isinstance(positions, tuple) for positions in compiled.combination_index[2].values())
+    for combination in itertools.product("ab", "cdz", [str(combination_ID) for combination_ID in list(combinations)[:20]] + ["0"]):
+        expected = sorted(combination_ID for combination_ID, other in combinations.items() if other == combination)
+        assert compiled.get_combination_IDs(combination) == expected
+        assert compiled.validate("_".join(combination)) == bool(expected)
+    for first, second in itertools.product("ab", "cdz"):
+        expected = sorted(combination_ID for combination_ID, other in combinations.items() if other[:2] == (first, second))
+        assert [compiled.combination_IDs[position] for position in validation._iter_positions(
+            compiled.match_combinations({1: first, 2: second}))] == expected
+
+
+def test_suggestions_match_combinations():
+    # The values of the first group that can be combined with "x" sort last, so suggesting them falls back to reading the candidates.
+    random_ = random.Random(0)
+    combinations = []
+    for index in range(2000):
+        first = "v%03d" % random_.randrange(1000)
+        combinations.append((first, "x" if first >= "v990" else random_.choice("yz"), random_.choice("ab")))
+    restrictions = [(group_number, value, combination_ID) for combination_ID, combination in enumerate(combinations, 1)
+                    for group_number, value in enumerate(combination, 1)]
+    compiled = validation.CompiledConvention(r"(\w+)_(\w)_(\w)", True, True, restrictions)
+    cases = ((1, "", {2: "x"}), (1, "v99", {2: "x", 3: "a"}), (1, "v1", {2: "y"}), (1, "", {3: "b"}), (2, "", {1: "v995"}),
+             (3, "", {1: "v001", 2: "z"}), (1, "w", {2: "y"}), (1, "", {2: "w"}), (1, "v00", {}))
+    for group_number, prefix, values in cases:
+        expected = sorted({combination[group_number - 1] for combination in combinations if combination[group_number - 1].startswith(prefix)
+                           and all(combination[other - 1] == value for other, value in values.items())})[:5]
+        assert compiled.suggest(group_number, prefix, values, 5) == expected